@@ -0,0 +1,180 @@
+# one btc price from several exchanges
+#
+# with more than one name in "btc_sources" the screen shows a composite of
+# all of them instead of trusting cex.io alone. every update fetches each
+# source that is due at the same time, on its own thread, and waits at most
+# btc_deadline_seconds for them. a source that misses the deadline is not
+# waited for: it keeps going in the background, whatever price it had before
+# is used this round and its new one is picked up as soon as it lands.
+#
+# the composite is either the median of the prices ("median") or an average
+# weighted by how fresh each price is ("weighted"), halving a price's weight
+# every btc_half_life_seconds. prices older than btc_max_age_seconds are left
+# out unless they are all we have. the first source is the primary one, its
+# 24h change, stats and sparkline are shown alongside the composite.
+#
+# a source is anything with update(), poll_interval() and a data attribute
+# holding a models.Ticker. add new ones to SOURCES.
+
+
+import importlib
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import models
+
+# setting name: (module, class)
+SOURCES = {
+    "cex": ("cex", "CEX"),
+    "bci": ("blockchaininfo", "BCI"),
+}
+
+
+class PriceAggregator:
+    def __init__(self, sources, settings=None, on_update=None):
+        settings = settings or {}
+
+        # {name: source}, primary first
+        self.sources = sources
+        self.primary = next(iter(sources.values()))
+
+        self.deadline = float(settings.get("btc_deadline_seconds", 5))
+        self.method = settings.get("btc_aggregate", "median")
+        self.half_life = float(settings.get("btc_half_life_seconds", 60))
+        self.max_age = float(settings.get("btc_max_age_seconds", 600))
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(sources), thread_name_prefix="btc"
+        )
+
+        # a source still busy from an earlier round is not started again
+        self.pending = {}
+
+        # the composite is worked out when someone asks for it after one of
+        # the sources has published something new, see data
+        self.lock = threading.Lock()
+        self.versions = None
+        self.composite = models.EMPTY_TICKER
+
+        # how long each source's last update took
+        self.timings = {}
+
+        # called with "cex" when a source that missed the deadline lands
+        # after all
+        self.on_update = on_update
+
+    def update(self):
+        futures = {}
+        for name, source in self.sources.items():
+            future = self.pending.get(name)
+            if future is None or future.done():
+                future = self.executor.submit(self.__fetch, name, source)
+                self.pending[name] = future
+            futures[name] = future
+
+        done, late = wait(futures.values(), timeout=self.deadline)
+        for name, future in futures.items():
+            if future in late:
+                print(f"{name} missed the {self.deadline:g}s btc deadline")
+                if self.on_update is not None:
+                    future.add_done_callback(lambda future: self.on_update("cex"))
+            elif future.exception() is not None:
+                print(f"{name} failed: {future.exception()!r}")
+
+    def __fetch(self, name, source):
+        started = time.time()
+        source.update()
+        self.timings[name] = round(time.time() - started, 3)
+
+    def poll_interval(self):
+        return min(source.poll_interval() for source in self.sources.values())
+
+    @property
+    def data(self):
+        # rebuilt only when a source has moved on, so reading it every frame
+        # is a handful of comparisons
+        versions = tuple(source.data.version for source in self.sources.values())
+        if versions != self.versions:
+            with self.lock:
+                if versions != self.versions:
+                    self.composite = self.combine(time.time())
+                    self.versions = versions
+        return self.composite
+
+    def combine(self, current_time):
+        quotes = [
+            (name, source.data)
+            for name, source in self.sources.items()
+            if source.data.fetched_at
+        ]
+        if not quotes:
+            return self.composite
+
+        fresh = [
+            (name, data)
+            for name, data in quotes
+            if current_time - data.fetched_at <= self.max_age
+        ]
+        used = fresh or quotes
+
+        prices = [data.btc_usd for name, data in used]
+        if self.method == "weighted":
+            weights = [
+                0.5 ** (max(0, current_time - data.fetched_at) / self.half_life)
+                for name, data in used
+            ]
+            price = sum(p * w for p, w in zip(prices, weights)) / sum(weights)
+        else:
+            price = statistics.median(prices)
+
+        # keep the previous different price so the movement does not drop to
+        # zero when the price holds still
+        previous = self.composite
+        last_btc_usd = previous.btc_usd
+        if price == last_btc_usd:
+            last_btc_usd = previous.last_btc_usd
+
+        primary = self.primary.data
+        return models.Ticker(
+            btc_usd=price,
+            last_btc_usd=last_btc_usd,
+            pct_chg=primary.pct_chg,
+            stats=primary.stats,
+            sparkline=primary.sparkline,
+            sources={name: [data.btc_usd, data.fetched_at] for name, data in quotes},
+            fetched_at=max(data.fetched_at for name, data in used),
+            version=previous.version + 1,
+        )
+
+    def restore(self, state, fetched_at):
+        # the last composite until the sources have fetched again
+        with self.lock:
+            self.composite = models.Ticker.from_state(
+                state, fetched_at, self.composite.version + 1
+            )
+            self.versions = tuple(
+                source.data.version for source in self.sources.values()
+            )
+
+
+def build(cex, settings, on_update=None):
+    # the btc source to show: cex on its own, or an aggregator over cex and
+    # the rest of btc_sources
+    names = settings.get("btc_sources", ["cex"])
+    if list(names) in ([], ["cex"]):
+        return cex
+
+    sources = {}
+    for name in names:
+        if name == "cex":
+            sources[name] = cex
+            continue
+        if name not in SOURCES:
+            print(f"Unknown btc source {name}")
+            continue
+        module, cls = SOURCES[name]
+        sources[name] = getattr(importlib.import_module(module), cls)(settings=settings)
+
+    return PriceAggregator(sources, settings, on_update)
@@ -0,0 +1,126 @@
+# a history of raw api responses, written off the fetch thread
+#
+# sources hand over the bytes exactly as they came off the wire and a
+# background thread appends them to a gzip file, so a fetch never waits on
+# the disk and nothing gets decoded and encoded again just to be saved. when
+# the file grows past max_bytes it is rotated like a log file:
+#
+#   archive/noaa.log.gz -> noaa.log.1.gz -> noaa.log.2.gz ... up to keep
+#
+# each record is a json header line followed by the raw body:
+#
+#   {"name": "noaa-forecast", "url": "...", "fetched_at": 1700000000.0, "length": 1234}\n
+#   <1234 bytes of body>\n
+#
+# anything else passed to record() goes in the header too. the http recorder
+# (http_client.configure) adds the status, headers and how long it took.
+#
+# gzip files can be appended to, every batch of records becomes its own gzip
+# member and gzip.open reads them back as one stream.
+
+
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+
+class ResponseArchive:
+    def __init__(
+        self, directory="archive", name="responses", max_bytes=8 << 20, keep=5
+    ):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name}.log.gz")
+        self.max_bytes = max_bytes
+        self.keep = max(1, int(keep))
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(
+            target=self.__writer, name=f"archive-{name}", daemon=True
+        )
+        self.thread.start()
+
+    def record(self, name, url, content, fetched_at=None, **extra):
+        # cheap enough to call from the fetch thread
+        if fetched_at is None:
+            fetched_at = time.time()
+        self.queue.put((name, url, content, fetched_at, extra))
+
+    def flush(self):
+        # wait until everything recorded so far is on disk
+        self.queue.join()
+
+    def __writer(self):
+        while True:
+            batch = [self.queue.get()]
+
+            # write whatever else is already waiting in the same gzip member
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.__write(batch)
+            except OSError as e:
+                print(f"Could not archive to {self.path}: {e}")
+            except Exception:
+                # a bad record must not kill the writer or flush() never returns
+                print(f"Could not archive to {self.path}")
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def __write(self, batch):
+        os.makedirs(self.directory, exist_ok=True)
+
+        with gzip.open(self.path, "ab") as file:
+            for name, url, content, fetched_at, extra in batch:
+                header = {
+                    "name": name,
+                    "url": url,
+                    "fetched_at": fetched_at,
+                    "length": len(content),
+                    **extra,
+                }
+                file.write(json.dumps(header).encode() + b"\n")
+                file.write(content)
+                file.write(b"\n")
+
+        if os.path.getsize(self.path) >= self.max_bytes:
+            self.__rotate()
+
+    def __rotate(self):
+        # the oldest file is overwritten by the one after it
+        base = self.path[: -len(".gz")]
+        for i in range(self.keep - 1, 0, -1):
+            older = f"{base}.{i}.gz"
+            if os.path.exists(older):
+                os.replace(older, f"{base}.{i + 1}.gz")
+        os.replace(self.path, f"{base}.1.gz")
+
+
+def read(path):
+    # yields (header, content) for every record in one archive file
+    with gzip.open(path, "rb") as file:
+        while True:
+            line = file.readline()
+            if not line:
+                return
+            header = json.loads(line)
+            content = file.read(header["length"])
+            file.readline()
+            yield header, content
+
+
+def latest(path):
+    # the newest body recorded under each name
+    responses = {}
+    for header, content in read(path):
+        responses[header["name"]] = content
+    return responses
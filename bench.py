@@ -0,0 +1,181 @@
+# headless frame time benchmark
+#
+#   python main.py --bench 600 --resolutions 1080p,4k [--fixtures DIR]
+#
+# runs the real render loop on the SDL dummy video driver with the data
+# sources fed from fixtures instead of the network, then prints frame time
+# percentiles and the time spent in each stage as json so runs can be
+# compared between commits. anything the sources print goes to stderr so it
+# does not get mixed into the report, and --output writes the report to a
+# file as well.
+#
+# frames are drawn as fast as possible but the clock they are drawn for
+# advances by 1 / fps per frame, so the hundredths, tenths and seconds change
+# as often as they would on a real screen.
+
+
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+# keep pygame's banner out of the report
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+import fixtures
+import profiling
+from cex import CEX
+from main import build_display, render_frame
+from noaa import NOAA
+from profiling import StageTimer, stage
+from weather import OpenWeatherMap
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+STAGES = ["fetch", "widgets", "text", "gauge", "blit", "flip"]
+
+
+def parse_resolution(name):
+    name = name.strip().lower()
+    if name in RESOLUTIONS:
+        return RESOLUTIONS[name]
+    width, height = name.split("x")
+    return (int(width), int(height))
+
+
+def load_settings():
+    # a real settings.json if there is one, otherwise the example so the
+    # benchmark runs on a fresh checkout
+    for path in ("settings.json", "settings.example.json"):
+        if os.path.exists(path):
+            with open(path) as json_file:
+                return json.load(json_file)
+    raise FileNotFoundError("settings.json")
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(seconds):
+    ordered = sorted(value * 1000 for value in seconds)
+    return {
+        "mean": round(sum(ordered) / max(len(ordered), 1), 4),
+        "p50": round(percentile(ordered, 50), 4),
+        "p95": round(percentile(ordered, 95), 4),
+        "p99": round(percentile(ordered, 99), 4),
+        "max": round(ordered[-1] if ordered else 0, 4),
+    }
+
+
+def publish(data, noaa, owm, cex):
+    # what a fetch does once the bytes have arrived
+    with stage("fetch"):
+        noaa.publish(
+            data["noaa-point"], data["noaa-forecast"], data["noaa-forecast-hourly"]
+        )
+        owm.parse(data["owm"])
+        cex.parse(data["cex"])
+
+
+def run_resolution(settings, size, frames, fetch_every, data, sources):
+    noaa, owm, cex = sources
+
+    screen = pygame.display.set_mode(size)
+    compositor, widgets = build_display(settings, screen, noaa, owm, cex)
+
+    timer = StageTimer()
+    profiling.record(timer)
+
+    frame_times = []
+    stage_times = {name: [] for name in STAGES}
+    start_time = time.time()
+    color_step = settings.get("color_step_seconds")
+
+    try:
+        for i in range(frames):
+            started = time.perf_counter()
+
+            if i % fetch_every == 0:
+                publish(data, noaa, owm, cex)
+
+            render_frame(
+                compositor,
+                widgets,
+                start_time + i / settings["fps"],
+                color_step,
+            )
+            pygame.event.pump()
+
+            frame_times.append(time.perf_counter() - started)
+
+            totals = timer.take()
+            for name in STAGES:
+                stage_times[name].append(totals.get(name, 0))
+    finally:
+        profiling.record(None)
+
+    return {
+        "size": list(size),
+        "frame_ms": summarize(frame_times),
+        "stages_ms": {name: summarize(stage_times[name]) for name in STAGES},
+    }
+
+
+def main(args):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    settings = load_settings()
+    data = fixtures.load(args.fixtures)
+    fetch_every = max(1, args.fetch_every)
+
+    report = {
+        "frames": args.bench,
+        "fetch_every": fetch_every,
+        "fixtures": args.fixtures or "synthetic",
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "settings": {
+            key: settings.get(key)
+            for key in ("fontSize", "tenths_or_hundredths", "dirty_rects")
+        },
+        "resolutions": {},
+    }
+
+    with contextlib.redirect_stdout(sys.stderr):
+        pygame.init()
+
+        sources = (
+            NOAA(settings=settings),
+            OpenWeatherMap(settings=settings),
+            # never the real tick history file, the screensaver may be using it
+            CEX(settings=dict(settings, btc_history_file=None)),
+        )
+
+        for name in args.resolutions.split(","):
+            size = parse_resolution(name)
+            report["resolutions"][name.strip()] = run_resolution(
+                settings, size, args.bench, fetch_every, data, sources
+            )
+
+        pygame.quit()
+
+    output = json.dumps(report, indent=4)
+    print(output)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
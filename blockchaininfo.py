@@ -1,23 +1,40 @@
 import json
 import time
-import requests
 
-class BCI:
-    def __init__(self):
+import models
+import resilience
+
+# settings can point us somewhere else, like stub_server.py
+BASE_URL = "https://blockchain.info"
+
+
+class BCI(resilience.PolledSource):
+    name = "Blockchain.info"
+
+    def __init__(self, settings=None):
 
         # load the settings.json into a settings object
-        with open("settings.json") as json_file:
-            settings = json.load(json_file)
+        if settings is None:
+            with open("settings.json") as json_file:
+                settings = json.load(json_file)
 
         # set the base URL
-        self.base_url = 'https://blockchain.info/ticker'
-
-        # set the default values
-        self.btc_usd = 0
+        self.base_url = settings.get("blockchaininfo_base_url", BASE_URL).rstrip("/")
 
+        # the price, replaced as a whole on every fetch like CEX does. see
+        # models.Ticker
+        self.data = models.EMPTY_TICKER
 
         self.last_update = 0
 
+        # stretch the interval to match the server's Cache-Control
+        self.respect_cache_control = bool(settings.get("respect_cache_control", False))
+        self.max_age = None
+
+        # timeouts, retries and a circuit breaker for blockchain.info
+        self.policy = resilience.FetchPolicy(settings)
+        self.breaker = resilience.breaker("bci", settings)
+
         # set the update interval to a minimum of 60 seconds
         self.update_interval = float(settings["blockchaininfo_update_minutes"]) * 60
         if self.update_interval < 60:
@@ -28,18 +45,24 @@ class BCI:
         # prevent updating too frequently
         if time.time() - self.last_update < self.update_interval:
             return
-        self.last_update = time.time()
 
         print("Updating Blockchain.info data...")
 
-        response = requests.get(self.base_url)
-        x = response.json()
-        print(x)
-        
-        self.btc_usd = float(x["USD"]["last"])
+        x = self.poll(self.base_url + "/ticker")
+        if x is None:
+            return
+
+        btc_usd = float(x["USD"]["last"])
+        self.data = self.data.replace(
+            btc_usd=btc_usd,
+            last_btc_usd=self.data.btc_usd,
+            fetched_at=time.time(),
+            version=self.data.version + 1,
+        )
+
 
 if __name__ == "__main__":
     bci = BCI()
     bci.update()
-    print(f"BTC/USD: {bci.btc_usd}")
+    print(f"BTC/USD: {bci.data.btc_usd}")
     bci.update()
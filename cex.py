@@ -1,19 +1,51 @@
 import json
+import threading
 import time
-import requests
 
+import models
+import resilience
+import ticks
 
-class CEX:
-    def __init__(self):
+# settings can point us somewhere else, like stub_server.py
+BASE_URL = "https://cex.io"
+
+
+class CEX(resilience.PolledSource):
+    name = "CEX.io"
+
+    def __init__(self, settings=None):
 
         # load the settings.json into a settings object
-        with open("settings.json") as json_file:
-            settings = json.load(json_file)
+        if settings is None:
+            with open("settings.json") as json_file:
+                settings = json.load(json_file)
 
-        self.btc_usd = 0
-        self.last_btc_usd = 0
-        self.pct_chg = "-0%"
         self.last_update = 0
+
+        self.base_url = settings.get("cex_base_url", BASE_URL).rstrip("/")
+
+        # stretch the interval to match the server's Cache-Control
+        self.respect_cache_control = bool(settings.get("respect_cache_control", False))
+        self.max_age = None
+
+        # timeouts, retries and a circuit breaker for cex.io
+        self.policy = resilience.FetchPolicy(settings)
+        self.breaker = resilience.breaker("cex", settings)
+
+        # the price, replaced as a whole on every fetch so the render loop
+        # never pairs a new price with an old one. see models.Ticker
+        self.data = models.EMPTY_TICKER
+
+        # the poller and the price stream (cex_stream.py) can both publish
+        self.lock = threading.Lock()
+
+        # when the stream last gave us a price. while it is flowing polling
+        # is only a fallback and stands down
+        self.streamed_at = 0
+
+        # the last day of ticks with rolling stats, see ticks.py
+        self.history = ticks.TickHistory(settings)
+
         self.update_interval = float(settings["cex_update_minutes"]) * 60
         if self.update_interval < 1:
             self.update_interval = 1
@@ -23,24 +55,68 @@ class CEX:
         # prevent updating too frequently
         if time.time() - self.last_update < self.update_interval:
             return
-        self.last_update = time.time()
+
+        # the stream is keeping the price current
+        if time.time() - self.streamed_at < self.update_interval:
+            return
 
         print("Updating CEX.io data...")
 
-        complete_url = "https://cex.io/api/ticker/BTC/USD"
-        response = requests.get(complete_url)
-        x = response.json()
-        print(x)
-        last_backup = self.last_btc_usd
-        self.last_btc_usd = self.btc_usd
-        self.btc_usd = (float(x["bid"]) + float(x["ask"])) / 2
-        if self.btc_usd == self.last_btc_usd:
-            self.last_btc_usd = last_backup
-        self.pct_chg = x["priceChangePercentage"] + "%"
+        complete_url = f"{self.base_url}/api/ticker/BTC/USD"
+        x = self.poll(complete_url)
+        if x is not None:
+            self.parse(x)
+
+    def parse(self, x):
+        self.publish_price(
+            float(x["bid"]), float(x["ask"]), x["priceChangePercentage"] + "%"
+        )
+
+    def publish_price(self, bid, ask, pct_chg=None, streamed=False):
+        # pct_chg None keeps the last one, the stream does not send it
+        btc_usd = (bid + ask) / 2
+        now = time.time()
+
+        with self.lock:
+            data = self.data
+
+            # most ticks between recorded ones leave the stats and sparkline
+            # alone, so the ticker keeps the very same objects
+            self.history.add(now, bid, ask)
+
+            # keep the previous different price so the movement does not drop
+            # to zero when the price holds still
+            last_btc_usd = data.btc_usd
+            if btc_usd == last_btc_usd:
+                last_btc_usd = data.last_btc_usd
+
+            self.data = models.Ticker(
+                btc_usd=btc_usd,
+                last_btc_usd=last_btc_usd,
+                pct_chg=data.pct_chg if pct_chg is None else pct_chg,
+                stats=self.history.stats,
+                sparkline=self.history.sparkline,
+                sources={},
+                fetched_at=now,
+                version=data.version + 1,
+            )
+
+            if streamed:
+                self.streamed_at = self.data.fetched_at
+
+    def restore(self, state, fetched_at):
+        data = models.Ticker.from_state(state, fetched_at, self.data.version + 1)
+
+        # a history kept on disk is at least as new as the snapshot's copy
+        if self.history.sparkline:
+            data = data.replace(
+                stats=self.history.stats, sparkline=self.history.sparkline
+            )
+        self.data = data
 
 
 if __name__ == "__main__":
     cex = CEX()
     cex.update()
-    print(f"BTC/USD: {cex.btc_usd}")
+    print(f"BTC/USD: {cex.data.btc_usd}")
     cex.update()
@@ -0,0 +1,180 @@
+# streams the btc price from cex.io instead of polling for it
+#
+# with "cex_stream": true in settings.json we keep a websocket open to the
+# cex.io public feed on an asyncio loop in a background thread, subscribe to
+# the tickers room and push every BTC/USD tick straight into CEX. cex.io
+# sends {"e": "ping"} every so often and expects {"e": "pong"} back, and
+# if we hear nothing at all for cex_stream_heartbeat_seconds we assume the
+# connection is dead and reconnect, backing off with jitter between tries.
+#
+# the regular CEX polling keeps running underneath. it stands down while
+# ticks are arriving and picks up again by itself if the stream goes quiet.
+#
+# stub_feed.py serves the same protocol locally for testing.
+
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+import resilience
+import ws
+
+
+class CexStream:
+    def __init__(self, cex, settings, on_update=None):
+        self.cex = cex
+        self.url = settings.get("cex_stream_url", "wss://ws.cex.io/ws")
+        self.heartbeat = float(settings.get("cex_stream_heartbeat_seconds", 30))
+
+        # the same backoff the http fetches use, for reconnecting
+        self.policy = resilience.FetchPolicy(settings)
+
+        # called with "cex" from the stream thread after every tick
+        self.on_update = on_update
+
+        self.connected = False
+        self.messages = 0
+        self.ticks = 0
+        self.reconnects = 0
+
+        # seconds from the feed stamping a tick to us publishing it, when the
+        # feed stamps them (the stub does, cex.io does not)
+        self.latencies = deque(maxlen=1000)
+
+        self.loop = None
+        self.stopping = None
+        self.thread = None
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.stopping = asyncio.Event()
+            started.set()
+            self.loop.run_until_complete(self.__run())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="cex-stream", daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def stop(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        stats = {
+            "connected": self.connected,
+            "messages": self.messages,
+            "ticks": self.ticks,
+            "reconnects": self.reconnects,
+        }
+        if latencies:
+            stats["latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 3),
+                "max": round(latencies[-1] * 1000, 3),
+            }
+        return stats
+
+    async def __run(self):
+        attempt = 0
+        while not self.stopping.is_set():
+            socket = None
+            try:
+                socket = await ws.connect(self.url, timeout=self.policy.connect_timeout)
+                self.connected = True
+                attempt = 0
+                await socket.send(json.dumps({"e": "subscribe", "rooms": ["tickers"]}))
+                await self.__listen(socket)
+            except asyncio.TimeoutError:
+                # before OSError, which it is a subclass of on newer pythons
+                print("CEX stream: no heartbeat, reconnecting")
+            except (ws.ConnectionClosed, OSError, ValueError) as e:
+                print(f"CEX stream: {e}")
+            finally:
+                self.connected = False
+                if socket is not None:
+                    await socket.close()
+
+            if self.stopping.is_set():
+                return
+
+            # back off before trying again, waking early if we are stopped
+            self.reconnects += 1
+            delay = max(0.5, self.policy.delay(attempt))
+            attempt += 1
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __listen(self, socket):
+        stopping = asyncio.ensure_future(self.stopping.wait())
+        try:
+            while True:
+                receive = asyncio.ensure_future(socket.recv())
+                done, pending = await asyncio.wait(
+                    (receive, stopping),
+                    timeout=self.heartbeat,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if stopping in done:
+                    receive.cancel()
+                    return
+                if not done:
+                    receive.cancel()
+                    raise asyncio.TimeoutError()
+
+                self.messages += 1
+                message = json.loads(receive.result())
+                event = message.get("e")
+
+                if event == "ping":
+                    await socket.send(json.dumps({"e": "pong"}))
+                elif event == "tick":
+                    self.__tick(message.get("data") or {})
+                elif event == "disconnecting":
+                    raise ws.ConnectionClosed(message.get("reason", "disconnecting"))
+        finally:
+            stopping.cancel()
+
+    def __tick(self, data):
+        if data.get("symbol1") != "BTC" or data.get("symbol2") != "USD":
+            return
+
+        # cex.io ticks only carry the last price, use bid and ask when a feed
+        # has them
+        try:
+            if "bid" in data and "ask" in data:
+                bid, ask = float(data["bid"]), float(data["ask"])
+            else:
+                bid = ask = float(data["price"])
+        except (KeyError, TypeError, ValueError):
+            print(f"CEX stream: ignoring tick {data}")
+            return
+
+        self.cex.publish_price(bid, ask, streamed=True)
+        self.ticks += 1
+
+        if "sent_at" in data:
+            self.latencies.append(time.time() - float(data["sent_at"]))
+
+        if self.on_update is not None:
+            self.on_update("cex")
+
+
+def start(cex, settings, on_update=None):
+    # a running stream, or None if streaming is off
+    if not settings.get("cex_stream", False):
+        return None
+
+    stream = CexStream(cex, settings, on_update)
+    stream.start()
+    return stream
@@ -0,0 +1,292 @@
+# runs the data sources in their own process
+#
+# with "collector": "process" in settings.json, NOAA, OpenWeatherMap and CEX
+# are fetched and parsed in a separate process so json decoding never
+# competes with the render loop for the GIL. the collector writes each
+# source's data into a block of shared memory and the render process only
+# ever reads it. the render process never imports the sources, and so never
+# imports requests.
+#
+# the shared block starts with a stop flag the render process sets to ask
+# the collector to exit, padded to 8 bytes, then has one fixed slot per
+# source:
+#
+#   sequence  uint64   odd while the slot is being written
+#   length    uint32   bytes of payload
+#   payload   json     {"fetched_at": ..., "version": ..., "state": ...}
+#
+# the writer bumps the sequence to odd, writes, then bumps it to even. a
+# reader copies the payload out and keeps it only if the sequence was the
+# same even number before and after, otherwise it tries again (a seqlock).
+# there is only ever one writer per slot so the writer never waits.
+#
+# the flag is polled rather than a multiprocessing.Event, setting an Event
+# takes a lock the child may have died holding. if the collector dies anyway
+# the watcher starts a new one on the same block, the render side never
+# notices anything but a gap in the updates.
+
+
+import json
+import multiprocessing
+import struct
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import models
+
+HEADER = struct.Struct("<QI")
+CONTROL = 8
+
+# name, bytes reserved for the payload and the data model
+SLOTS = [
+    ("noaa", 1 << 20, models.Forecast),
+    ("owm", 4096, models.Weather),
+    ("cex", 16384, models.Ticker),
+]
+
+EMPTY = {
+    "noaa": models.EMPTY_FORECAST,
+    "owm": models.EMPTY_WEATHER,
+    "cex": models.EMPTY_TICKER,
+}
+
+
+class SharedSnapshot:
+    def __init__(self, name=None, create=False):
+        self.offsets = {}
+        size = CONTROL
+        for slot, capacity, model in SLOTS:
+            self.offsets[slot] = (size, capacity)
+            size += HEADER.size + capacity
+
+        if create:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.memory.buf[:size] = bytes(size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+
+        self.name = self.memory.name
+        self.buffer = self.memory.buf
+
+    def stopping(self):
+        return self.buffer[0] != 0
+
+    def request_stop(self):
+        self.buffer[0] = 1
+
+    def sequence(self, slot):
+        offset, capacity = self.offsets[slot]
+        return struct.unpack_from("<Q", self.buffer, offset)[0]
+
+    def write(self, slot, data):
+        offset, capacity = self.offsets[slot]
+        payload = json.dumps(
+            {
+                "fetched_at": data.fetched_at,
+                "version": data.version,
+                "state": data.to_state(),
+            },
+            separators=(",", ":"),
+        ).encode()
+
+        if len(payload) > capacity:
+            print(f"{slot} data is {len(payload)} bytes, the slot holds {capacity}")
+            return
+
+        # a collector that died mid write leaves the sequence odd, round up
+        # so the slot still reads as being written until we are done
+        sequence = self.sequence(slot)
+        sequence += sequence % 2
+        struct.pack_into("<Q", self.buffer, offset, sequence + 1)
+        struct.pack_into("<I", self.buffer, offset + 8, len(payload))
+        start = offset + HEADER.size
+        self.buffer[start : start + len(payload)] = payload
+        struct.pack_into("<Q", self.buffer, offset, sequence + 2)
+
+    def read(self, slot, attempts=100):
+        # (sequence, payload bytes) or None if the writer kept getting in the
+        # way. sequence 0 means nothing has been written yet
+        offset, capacity = self.offsets[slot]
+        for attempt in range(attempts):
+            sequence, length = HEADER.unpack_from(self.buffer, offset)
+            if sequence % 2:
+                time.sleep(0)
+                continue
+
+            start = offset + HEADER.size
+            payload = bytes(self.buffer[start : start + min(length, capacity)])
+
+            if self.sequence(slot) == sequence:
+                return sequence, payload
+
+        return None
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+class RemoteSource:
+    # stands in for a data source in the render process. data is rebuilt
+    # from shared memory only when the collector has written something new
+    def __init__(self, shared, name):
+        self.shared = shared
+        self.name = name
+        self.model = dict((slot, model) for slot, capacity, model in SLOTS)[name]
+        self.sequence = 0
+        self.cached = EMPTY[name]
+
+    @property
+    def data(self):
+        if self.shared.sequence(self.name) != self.sequence:
+            result = self.shared.read(self.name)
+            if result is not None:
+                sequence, payload = result
+                snapshot = models.loads(payload)
+                self.cached = self.model.from_state(
+                    snapshot["state"], snapshot["fetched_at"], snapshot["version"]
+                )
+                self.sequence = sequence
+        return self.cached
+
+
+def collect(shared_name, settings, poll=0.25):
+    # the collector process. the sources are only imported here. runs until
+    # the render process sets the stop flag
+    import aggregator
+    import cex_stream
+    import http_client
+    from cex import CEX
+    from noaa import NOAA
+    from scheduler import FetchScheduler
+    from snapshot import SnapshotStore
+    from weather import OpenWeatherMap
+
+    shared = SharedSnapshot(shared_name)
+    http_client.configure(settings)
+
+    cex = CEX(settings=settings)
+    sources = {
+        "noaa": NOAA(logging_enabled=True, settings=settings),
+        "owm": OpenWeatherMap(settings=settings),
+        # publish is only defined below, but is only called once we are running
+        "cex": aggregator.build(cex, settings, on_update=lambda name: publish(name)),
+    }
+
+    # start from the last snapshots like the in process mode does
+    snapshots = SnapshotStore(settings.get("snapshot_directory", "snapshots"))
+    written = {}
+    for name, source in sources.items():
+        snapshots.load(name, source)
+
+    # the scheduler threads and the cex stream both publish, and a seqlock
+    # slot must only ever have one writer at a time
+    publishing = threading.Lock()
+
+    def publish(name):
+        with publishing:
+            data = sources[name].data
+            if data.fetched_at and written.get(name) != data.version:
+                shared.write(name, data)
+                written[name] = data.version
+
+    for name in sources:
+        publish(name)
+
+    def on_complete(name):
+        try:
+            snapshots.save(name, sources[name])
+            publish(name)
+        except Exception:
+            traceback.print_exc()
+
+    scheduler = FetchScheduler(workers=2, on_complete=on_complete)
+    for name, source in sources.items():
+        scheduler.add(name, source.update, source.poll_interval)
+    scheduler.start()
+
+    stream = cex_stream.start(cex, settings, on_update=publish)
+
+    # the fetching happens on the scheduler threads. once we are asked to
+    # stop, let the archives write out what they still have buffered
+    while not shared.stopping():
+        time.sleep(poll)
+    if stream is not None:
+        stream.stop()
+    for archive in (sources["noaa"].archive, http_client.client.recorder):
+        if archive is not None:
+            archive.flush()
+
+
+class Collector:
+    # owns the collector process and the shared memory from the render side
+    def __init__(self, settings):
+        self.shared = SharedSnapshot(create=True)
+        self.settings = settings
+        self.process = None
+
+        # held while starting or stopping so a restart never races stop()
+        self.lock = threading.Lock()
+        self.start()
+
+        self.sources = {name: RemoteSource(self.shared, name) for name in EMPTY}
+
+    def start(self):
+        # spawn rather than fork so the child starts clean instead of with a
+        # copy of our SDL state and threads. spawn still imports main.py in
+        # the child, and pygame along with it, but nothing there initializes
+        # pygame or opens a window
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=collect,
+            args=(self.shared.name, self.settings),
+            name="collector",
+            daemon=True,
+        )
+        self.process.start()
+
+    def watch(self, on_change, interval=0.25, restart_delay=30):
+        # calls on_change(name) from a background thread whenever the
+        # collector writes a slot, so adaptive pacing still wakes up for it.
+        # also starts a new collector if the old one dies, at most once per
+        # restart_delay seconds so one that dies on startup does not spin
+        def watcher():
+            sequences = {name: 0 for name in self.sources}
+            started = time.time()
+            while not self.shared.stopping():
+                if not self.process.is_alive():
+                    print(f"collector exited with code {self.process.exitcode}")
+                    time.sleep(max(0, started + restart_delay - time.time()))
+                    with self.lock:
+                        if self.shared.stopping():
+                            break
+                        print("restarting the collector")
+                        started = time.time()
+                        self.start()
+
+                for name in sequences:
+                    sequence = self.shared.sequence(name)
+                    if sequence != sequences[name]:
+                        sequences[name] = sequence
+                        on_change(name)
+                time.sleep(interval)
+
+        threading.Thread(target=watcher, name="collector-watch", daemon=True).start()
+
+    def stop(self, timeout=10):
+        # ask the collector to flush its archives and exit, and only kill it
+        # if it has not gone within timeout seconds
+        with self.lock:
+            self.shared.request_stop()
+        if self.process.is_alive():
+            self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            print("collector did not stop, terminating it")
+            self.process.terminate()
+            self.process.join(timeout=5)
+        self.shared.unlink()
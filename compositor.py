@@ -0,0 +1,106 @@
+# keeps track of everything on screen so we only redraw what changed
+#
+# every element is a named layer holding its last surface, where it was drawn
+# and a key describing its content. placing a layer marks its old and new
+# rects dirty. present() then restores the background under just those rects,
+# redraws any layers that overlap them and pushes only those rects to the
+# display with pygame.display.update(rects).
+#
+# with dirty_rects off we fall back to clearing and flipping the whole screen
+# every frame like we always used to.
+
+
+import pygame
+
+from profiling import stage
+
+
+class Compositor:
+    def __init__(self, screen, dirty_rects=True):
+        self.screen = screen
+        self.dirty_rects = bool(dirty_rects)
+        self.background = None
+        self.layers = {}
+        self.dirty = []
+        self.full_redraw = True
+
+    def is_current(self, name, key):
+        # true if the layer is already showing this content
+        layer = self.layers.get(name)
+        return layer is not None and key is not None and layer[2] == key
+
+    def place(self, name, surface, position, key=None):
+        rect = surface.get_rect(topleft=position)
+
+        old = self.layers.get(name)
+        if old is not None:
+            self.__mark(old[1])
+
+        self.layers[name] = (surface, rect, key)
+        self.__mark(rect)
+
+    def remove(self, name):
+        old = self.layers.pop(name, None)
+        if old is not None:
+            self.__mark(old[1])
+
+    def set_background(self, surface):
+        # None means plain black
+        self.background = surface
+        self.invalidate()
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def present(self):
+        if not self.dirty_rects or self.full_redraw:
+            with stage("blit"):
+                self.__redraw(self.screen.get_rect())
+            with stage("flip"):
+                pygame.display.flip()
+            self.full_redraw = False
+            self.dirty = []
+            return
+
+        if not self.dirty:
+            return
+
+        with stage("blit"):
+            for rect in self.dirty:
+                self.screen.set_clip(rect)
+                self.__redraw(rect)
+            self.screen.set_clip(None)
+
+        with stage("flip"):
+            pygame.display.update(self.dirty)
+        self.dirty = []
+
+    def __mark(self, rect):
+        if self.full_redraw or not self.dirty_rects:
+            return
+
+        # merge into any rect it touches so overlapping layers are only
+        # redrawn once
+        rect = rect.clip(self.screen.get_rect())
+        if rect.width == 0 or rect.height == 0:
+            return
+
+        merged = True
+        while merged:
+            merged = False
+            for i, other in enumerate(self.dirty):
+                if rect.colliderect(other):
+                    rect = rect.union(self.dirty.pop(i))
+                    merged = True
+                    break
+        self.dirty.append(rect)
+
+    def __redraw(self, rect):
+        if self.background is None:
+            self.screen.fill((0, 0, 0), rect)
+        else:
+            self.screen.blit(self.background, rect, rect)
+
+        for surface, layer_rect, key in self.layers.values():
+            if layer_rect.colliderect(rect):
+                self.screen.blit(surface, layer_rect)
@@ -0,0 +1,232 @@
+# canned api responses so we can run without the network or api keys
+#
+# everything here is shaped like the real responses from api.weather.gov,
+# openweathermap and cex.io. the synthetic forecasts are built around the
+# current hour, so they are always "live", and can be made as long as we like
+# to see how things scale. recorded responses can be loaded instead, either
+# from a directory of noaa-point.json, noaa-forecast.json,
+# noaa-forecast-hourly.json, owm.json and cex.json or straight from the
+# response archive NOAA keeps with logging enabled (archive/noaa.log.gz).
+# old hourly forecasts get shifted up to the present.
+
+
+import json
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import archive
+
+WIND_DIRECTIONS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+SHORT_FORECASTS = ["Sunny", "Mostly Sunny", "Partly Cloudy", "Chance Rain Showers"]
+
+
+def hour_start(current_time):
+    return int(current_time) // 3600 * 3600
+
+
+def synthetic_points(lat="37.0", lon="-77.0"):
+    base = "https://api.weather.gov/gridpoints/AKQ/45,76"
+    return {
+        "properties": {
+            "forecast": f"{base}/forecast",
+            "forecastHourly": f"{base}/forecast/hourly",
+            "relativeLocation": {"properties": {"city": "Synthetic", "state": "VA"}},
+            "gridId": "AKQ",
+            "gridX": 45,
+            "gridY": 76,
+            "latitude": lat,
+            "longitude": lon,
+        }
+    }
+
+
+def synthetic_hourly(periods=156, current_time=None, utc_offset_hours=-4):
+    if current_time is None:
+        current_time = time.time()
+
+    tz = timezone(timedelta(hours=utc_offset_hours))
+    start = hour_start(current_time)
+
+    hourly = []
+    for i in range(periods):
+        begin = start + i * 3600
+        hour = datetime.fromtimestamp(begin, tz).hour
+
+        # a smooth daily swing plus a slower drift so no two days match
+        temperature = round(
+            60 + 12 * math.sin((hour - 9) / 24 * 2 * math.pi) + 5 * math.sin(i / 40)
+        )
+        rain = max(0, round(50 * math.sin(i / 7)))
+        humidity = 60 + round(25 * math.cos((hour - 4) / 24 * 2 * math.pi))
+
+        hourly.append(
+            {
+                "number": i + 1,
+                "name": "",
+                "startTime": datetime.fromtimestamp(begin, tz).isoformat(),
+                "endTime": datetime.fromtimestamp(begin + 3600, tz).isoformat(),
+                "isDaytime": 6 <= hour < 18,
+                "temperature": temperature,
+                "temperatureUnit": "F",
+                "temperatureTrend": "",
+                "probabilityOfPrecipitation": {
+                    "unitCode": "wmoUnit:percent",
+                    "value": rain,
+                },
+                "dewpoint": {
+                    "unitCode": "wmoUnit:degC",
+                    "value": round((temperature - 32) * 5 / 9 - 4, 2),
+                },
+                "relativeHumidity": {
+                    "unitCode": "wmoUnit:percent",
+                    "value": humidity,
+                },
+                "windSpeed": f"{5 + i % 10} mph",
+                "windDirection": WIND_DIRECTIONS[i % len(WIND_DIRECTIONS)],
+                "icon": "https://api.weather.gov/icons/land/day/few?size=small",
+                "shortForecast": SHORT_FORECASTS[(i // 6) % len(SHORT_FORECASTS)],
+                "detailedForecast": "",
+            }
+        )
+
+    return {"properties": {"periods": hourly}}
+
+
+def synthetic_forecast(periods=14, current_time=None, utc_offset_hours=-4):
+    if current_time is None:
+        current_time = time.time()
+
+    tz = timezone(timedelta(hours=utc_offset_hours))
+    start = hour_start(current_time)
+
+    forecast = []
+    for i in range(periods):
+        begin = start + i * 12 * 3600
+        short_forecast = SHORT_FORECASTS[i % len(SHORT_FORECASTS)]
+        forecast.append(
+            {
+                "number": i + 1,
+                "name": "Today" if i == 0 else f"Period {i + 1}",
+                "startTime": datetime.fromtimestamp(begin, tz).isoformat(),
+                "endTime": datetime.fromtimestamp(begin + 12 * 3600, tz).isoformat(),
+                "isDaytime": i % 2 == 0,
+                "temperature": 70 if i % 2 == 0 else 52,
+                "temperatureUnit": "F",
+                "windSpeed": "5 to 10 mph",
+                "windDirection": "SW",
+                "shortForecast": short_forecast,
+                "detailedForecast": f"{short_forecast}, with a high near 70.",
+            }
+        )
+
+    return {"properties": {"periods": forecast}}
+
+
+def synthetic_owm(current_time=None):
+    if current_time is None:
+        current_time = time.time()
+
+    # sunrise and sunset for the local day we are in
+    midnight = time.mktime(time.localtime(current_time)[:3] + (0, 0, 0, 0, 0, -1))
+
+    return {
+        "cod": 200,
+        "main": {
+            "temp": 290.15,
+            "feels_like": 289.5,
+            "pressure": 1015,
+            "humidity": 60,
+        },
+        "weather": [{"main": "Clear", "description": "clear sky"}],
+        "wind": {"speed": 3.6, "deg": 220, "gust": 6.2},
+        "visibility": 10000,
+        "sys": {
+            "sunrise": int(midnight + 6.5 * 3600),
+            "sunset": int(midnight + 19 * 3600),
+        },
+        "name": "Synthetic",
+    }
+
+
+def synthetic_cex(price=64000.0, spread=10.0):
+    return {
+        "timestamp": str(int(time.time())),
+        "low": str(price * 0.97),
+        "high": str(price * 1.02),
+        "last": str(price),
+        "volume": "812.5",
+        "volume30d": "21000.1",
+        "bid": price - spread / 2,
+        "ask": price + spread / 2,
+        "priceChange": "312.4",
+        "priceChangePercentage": "0.49",
+        "pair": "BTC:USD",
+    }
+
+
+def synthetic_bci(price=64000.0):
+    return {
+        "USD": {
+            "15m": price,
+            "last": price,
+            "buy": price,
+            "sell": price,
+            "symbol": "USD",
+        }
+    }
+
+
+def rebase_hourly(data, current_time=None):
+    # shift a recorded hourly forecast by whole hours so its first period is
+    # the one we are in now
+    if current_time is None:
+        current_time = time.time()
+
+    periods = data["properties"]["periods"]
+    if not periods:
+        return data
+
+    first = datetime.fromisoformat(periods[0]["startTime"])
+    shift = timedelta(hours=(hour_start(current_time) - first.timestamp()) // 3600)
+    if not shift:
+        return data
+
+    for period in periods:
+        for field in ("startTime", "endTime"):
+            period[field] = (datetime.fromisoformat(period[field]) + shift).isoformat()
+
+    return data
+
+
+def load(directory=None, periods=156):
+    # everything the sources need, from a directory of recordings where we
+    # have them and synthetic data where we do not
+    fixtures = {
+        "noaa-point": synthetic_points(),
+        "noaa-forecast": synthetic_forecast(),
+        "noaa-forecast-hourly": synthetic_hourly(periods),
+        "owm": synthetic_owm(),
+        "cex": synthetic_cex(),
+        "bci": synthetic_bci(),
+    }
+
+    if directory is not None and os.path.isfile(directory):
+        # the newest of each response in an archive
+        for name, content in archive.latest(directory).items():
+            if name in fixtures:
+                fixtures[name] = json.loads(content)
+
+        rebase_hourly(fixtures["noaa-forecast-hourly"])
+
+    elif directory is not None:
+        for name in fixtures:
+            path = os.path.join(directory, f"{name}.json")
+            if os.path.exists(path):
+                with open(path) as file:
+                    fixtures[name] = json.load(file)
+
+        rebase_hourly(fixtures["noaa-forecast-hourly"])
+
+    return fixtures
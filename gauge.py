@@ -0,0 +1,65 @@
+# pre-rendered sprites for the tenths gauge
+#
+# the gauge only ever has ten states, so rather than drawing nine arcs every
+# frame we draw each state once per resolution and font size into a sprite
+# sheet. the lit segments are drawn in neutral grays and tinted to the
+# current font color when used. the unlit ring never changes color so it is
+# its own sprite and never gets tinted.
+
+
+import pygame
+
+from profiling import stage
+from render_cache import tint
+
+SEGMENTS = 9
+STATES = 10
+UNLIT_COLOR = (33, 33, 33)
+
+
+def segment_angles(i):
+    start_angle = i / SEGMENTS * 2 * 3.14159
+    stop_angle = (i + 1) / SEGMENTS * 2 * 3.14159
+    return start_angle, stop_angle
+
+
+class GaugeSprites:
+    def __init__(self, size, thickness):
+        self.size = size
+        self.thickness = thickness
+
+        rect = (0, 0, size, size)
+
+        # every segment in the disabled color
+        self.ring = pygame.Surface((size, size), pygame.SRCALPHA)
+        for i in range(SEGMENTS):
+            start_angle, stop_angle = segment_angles(i)
+            pygame.draw.arc(
+                self.ring, UNLIT_COLOR, rect, start_angle, stop_angle, thickness
+            )
+
+        # state n has the first n segments lit, each a little brighter than
+        # the last. multiplying by font_color later gives font_color * scaler
+        self.sheet = pygame.Surface((size * STATES, size), pygame.SRCALPHA)
+        for state in range(STATES):
+            for i in range(state):
+                scaler = (i + 20) / 30
+                gray = int(255 * scaler)
+                start_angle, stop_angle = segment_angles(i)
+                pygame.draw.arc(
+                    self.sheet,
+                    (gray, gray, gray),
+                    (state * size, 0, size, size),
+                    start_angle,
+                    stop_angle,
+                    thickness,
+                )
+
+        self.states = [
+            self.sheet.subsurface((state * size, 0, size, size))
+            for state in range(STATES)
+        ]
+
+    def lit(self, tenths, color):
+        with stage("gauge"):
+            return tint(self.states[tenths], color)
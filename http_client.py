@@ -0,0 +1,165 @@
+# one place for every data source to make its http requests
+#
+# keeps a pooled keep-alive session per host so we are not paying for a new
+# tcp and tls handshake on every fetch, remembers the ETag and Last-Modified
+# of everything we have fetched so the next request can be conditional, and
+# works out how long the server says a response stays fresh so sources can
+# back off to match.
+#
+# a 304 comes back as a response with not_modified set. the caller keeps
+# whatever it parsed last time and skips parsing again.
+#
+# with "record_directory" in settings.json every response is also written
+# to a response archive (archive.py) with its status, headers and how long it
+# took, for stub_server.py to replay later. query strings are left out of
+# the recording since that is where api keys go.
+
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from archive import ResponseArchive
+
+
+def freshness(headers):
+    # seconds the server says this response stays fresh for, or None if it
+    # did not say
+    cache_control = headers.get("Cache-Control", "")
+    directives = {}
+    for directive in cache_control.split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+
+    if "no-store" in directives or "no-cache" in directives:
+        return 0
+
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(0, int(directives[name]))
+            except ValueError:
+                pass
+
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            expires = parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return 0
+
+        # measure against the server's clock if it told us the time
+        now = time.time()
+        date = headers.get("Date")
+        if date:
+            try:
+                now = parsedate_to_datetime(date).timestamp()
+            except (TypeError, ValueError):
+                pass
+        return max(0, expires - now)
+
+    return None
+
+
+class HttpClient:
+    def __init__(self, pool_size=4):
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.validators = {}
+        self.lock = threading.Lock()
+
+        # a ResponseArchive when we are recording, see configure()
+        self.recorder = None
+
+    def session(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def get(self, url, conditional=True, **kwargs):
+        headers = dict(kwargs.pop("headers", None) or {})
+
+        if conditional:
+            with self.lock:
+                etag, last_modified = self.validators.get(url, (None, None))
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        started = time.time()
+        response = self.session(url).get(url, headers=headers, **kwargs)
+        if self.recorder is not None:
+            self.__record(url, response, started)
+
+        response.not_modified = response.status_code == 304
+        response.max_age = freshness(response.headers)
+
+        if response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            with self.lock:
+                if etag or last_modified:
+                    self.validators[url] = (etag, last_modified)
+                else:
+                    self.validators.pop(url, None)
+
+        return response
+
+    def __record(self, url, response, started):
+        parts = urlsplit(url)
+        self.recorder.record(
+            parts.path,
+            f"{parts.scheme}://{parts.netloc}{parts.path}",
+            response.content,
+            started,
+            status=response.status_code,
+            headers=dict(response.headers),
+            elapsed=round(time.time() - started, 4),
+        )
+
+    def forget(self, url):
+        # drop the validators for a url so the next request is unconditional,
+        # for when we threw away what we parsed from it
+        with self.lock:
+            self.validators.pop(url, None)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+# shared by every source so connections to the same host are reused
+client = HttpClient()
+
+
+def configure(settings):
+    # start recording if settings ask for it
+    directory = settings.get("record_directory")
+    if directory and client.recorder is None:
+        client.recorder = ResponseArchive(
+            directory,
+            "http",
+            max_bytes=int(float(settings.get("archive_max_mb", 8)) * (1 << 20)),
+            keep=settings.get("archive_keep", 5),
+        )
+
+
+def stretch_interval(interval, max_age, enabled):
+    # poll no more often than the server says its data changes
+    if not enabled or max_age is None:
+        return interval
+    return max(interval, max_age)
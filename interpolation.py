@@ -0,0 +1,170 @@
+# smooth values between the points of the hourly forecast
+#
+# every hourly period gives a temperature, dew point, humidity, wind speed
+# and rain chance for the start of its hour. a Curve joins those points up
+# so any of them can be read at any moment, not just on the hour.
+#
+# the default is a monotone cubic (the same slopes as PCHIP): it passes
+# through every point and is smooth, but never overshoots between two of
+# them, so there is no phantom high between two equally warm hours and the
+# rain chance never dips below zero. "linear" joins the points with straight
+# lines instead.
+#
+# each curve is worked out once per fetch, the first time it is read, into a
+# table of cubic coefficients with one row per hour. the hours are evenly
+# spaced so finding the row for a time is a division instead of a search,
+# and reading a value is a handful of multiplies, cheap enough to do every
+# frame.
+
+
+import re
+from array import array
+from bisect import bisect_right
+
+CUBIC = "cubic"
+LINEAR = "linear"
+
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def mph(wind_speed):
+    # "10 mph" -> 10, "10 to 15 mph" -> 12.5
+    numbers = [float(number) for number in NUMBER.findall(str(wind_speed or ""))]
+    if not numbers:
+        return None
+    return sum(numbers) / len(numbers)
+
+
+def slopes(times, values):
+    # the slope at each point, chosen so the curve never overshoots
+    n = len(values)
+    h = [times[k + 1] - times[k] for k in range(n - 1)]
+    delta = [(values[k + 1] - values[k]) / h[k] for k in range(n - 1)]
+
+    if n == 2:
+        return [delta[0], delta[0]]
+
+    m = [0.0] * n
+    for k in range(1, n - 1):
+        # flat at a peak, a valley or a plateau, otherwise a weighted
+        # harmonic mean of the slopes either side
+        if delta[k - 1] * delta[k] > 0:
+            w1 = 2 * h[k] + h[k - 1]
+            w2 = h[k] + 2 * h[k - 1]
+            m[k] = (w1 + w2) / (w1 / delta[k - 1] + w2 / delta[k])
+
+    m[0] = end_slope(h[0], h[1], delta[0], delta[1])
+    m[-1] = end_slope(h[-1], h[-2], delta[-1], delta[-2])
+    return m
+
+
+def end_slope(h0, h1, delta0, delta1):
+    # a one sided three point estimate, kept from overshooting
+    m = ((2 * h0 + h1) * delta0 - h0 * delta1) / (h0 + h1)
+    if m * delta0 <= 0:
+        return 0.0
+    if delta0 * delta1 <= 0 and abs(m) > abs(3 * delta0):
+        return 3 * delta0
+    return m
+
+
+class Curve:
+    def __init__(self, times, values, method=CUBIC):
+        # times ascending. points without a value are skipped
+        points = [(t, float(v)) for t, v in zip(times, values) if v is not None]
+        self.times = array("d", (t for t, v in points))
+        self.values = array("d", (v for t, v in points))
+
+        n = len(points)
+
+        # four coefficients per segment: value = a + b*s + c*s^2 + d*s^3
+        # with s running from 0 to 1 across the segment
+        self.table = array("d")
+        if n >= 2:
+            times, values = self.times, self.values
+            if method == LINEAR:
+                for k in range(n - 1):
+                    self.table.extend((values[k], values[k + 1] - values[k], 0, 0))
+            else:
+                m = slopes(times, values)
+                for k in range(n - 1):
+                    h = times[k + 1] - times[k]
+                    y0, y1 = values[k], values[k + 1]
+                    b0, b1 = h * m[k], h * m[k + 1]
+                    self.table.extend(
+                        (y0, b0, 3 * (y1 - y0) - 2 * b0 - b1, 2 * (y0 - y1) + b0 + b1)
+                    )
+
+        # evenly spaced points let us find a segment without searching
+        self.step = None
+        if n >= 2:
+            step = (self.times[-1] - self.times[0]) / (n - 1)
+            if all(
+                abs(self.times[k + 1] - self.times[k] - step) < 1 for k in range(n - 1)
+            ):
+                self.step = step
+
+    def __len__(self):
+        return len(self.times)
+
+    def sample(self, t):
+        # the value at unix time t, held flat before the first point and
+        # after the last. None if there are no points at all
+        times = self.times
+        if not times:
+            return None
+        if t <= times[0]:
+            return self.values[0]
+        if t >= times[-1]:
+            return self.values[-1]
+
+        if self.step is not None:
+            k = min(int((t - times[0]) / self.step), len(times) - 2)
+        else:
+            k = bisect_right(times, t) - 1
+
+        s = (t - times[k]) / (times[k + 1] - times[k])
+        i = k * 4
+        table = self.table
+        return table[i] + s * (table[i + 1] + s * (table[i + 2] + s * table[i + 3]))
+
+
+# how to read each field from an hourly period
+FIELDS = {
+    "temperature": lambda period: period.temperature,
+    "dewpoint": lambda period: period.dewpoint,
+    "humidity": lambda period: period.humidity,
+    "wind_speed": lambda period: mph(period.wind_speed),
+    # the api sends null for no chance at all
+    "rain_chance": lambda period: period.rain_chance or 0,
+}
+
+
+class ForecastCurves:
+    # a Curve for every field of the hourly forecast, each built the first
+    # time it is asked for
+    def __init__(self, periods, method=CUBIC):
+        self.periods = periods
+        self.method = method
+        self.curves = {}
+
+        # each period's value belongs to the start of its hour, which is
+        # where the period before it ended
+        end_times = [period.end_time for period in periods]
+        self.start_times = []
+        if end_times:
+            length = end_times[1] - end_times[0] if len(end_times) > 1 else 3600
+            self.start_times = [end_times[0] - length] + end_times[:-1]
+
+    def curve(self, field):
+        curve = self.curves.get(field)
+        if curve is None:
+            read = FIELDS[field]
+            curve = Curve(
+                self.start_times, [read(period) for period in self.periods], self.method
+            )
+            self.curves[field] = curve
+        return curve
+
+    def sample(self, field, t):
+        return self.curve(field).sample(t)
@@ -0,0 +1,167 @@
+# microbenchmarks for the data layer
+#
+#   python microbench.py [--sizes 24,156,1000,10000] [--repeat 3]
+#       [--baseline microbench.json [--save] [--threshold 0.25]]
+#
+# times the NOAA getters the widgets lean on, NOAA publishing a whole
+# forecast, the OpenWeatherMap and CEX parsing and format_usd, against
+# synthetic forecasts from fixtures.py with as many periods as --sizes asks
+# for. every result is nanoseconds per call, the best of --repeat runs.
+# frame[n] adds up the getters and format_usd, what one frame would cost if
+# every widget asked for everything once, which is the worst case now that
+# widgets only redraw when their data changes.
+#
+# with --baseline the run is compared with a saved one and the exit status
+# is 1 if anything got slower by more than --threshold (0.25 is 25%). --save
+# writes this run as the new baseline instead. baselines only mean something
+# on the machine that made them, so none is kept in the repo. make one before
+# changing anything with
+#
+#   python microbench.py --baseline microbench.json --save
+#
+# and compare against it afterwards with --baseline microbench.json.
+#
+# whatever the sources print while they are being timed is thrown away, so
+# the numbers are parsing and not terminal output.
+
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+
+# keep pygame's banner out of the report, widgets imports it
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import fixtures
+from bench import load_settings
+from cex import CEX
+from noaa import NOAA
+from weather import OpenWeatherMap
+from widgets import format_usd
+
+# the getters that make up a frame
+GETTERS = [
+    "get_active_periods",
+    "get_hourly_temperatures",
+    "get_hourly_rain_chances",
+    "get_current_hourly_forecast",
+    "get_instantaneous_temperature",
+]
+
+
+def per_call(function, repeat):
+    # nanoseconds per call, best of repeat runs of enough calls to take a
+    # fifth of a second
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def run(settings, sizes, repeat):
+    results = {}
+
+    noaa = NOAA(settings=settings)
+    points = fixtures.synthetic_points()
+    for size in sizes:
+        forecast = fixtures.synthetic_forecast(size)
+        hourly = fixtures.synthetic_hourly(size)
+
+        results[f"noaa.publish[{size}]"] = per_call(
+            lambda: noaa.publish(points, forecast, hourly), repeat
+        )
+
+        frame = 0
+        for name in GETTERS:
+            results[f"noaa.{name}[{size}]"] = per_call(getattr(noaa, name), repeat)
+            frame += results[f"noaa.{name}[{size}]"]
+        results[f"frame[{size}]"] = frame
+
+    owm = OpenWeatherMap(settings=settings)
+    owm_response = fixtures.synthetic_owm()
+    results["owm.parse"] = per_call(lambda: owm.parse(owm_response), repeat)
+
+    # never the real tick history file, the screensaver may be using it
+    cex = CEX(settings=dict(settings, btc_history_file=None))
+    cex_response = fixtures.synthetic_cex()
+    results["cex.parse"] = per_call(lambda: cex.parse(cex_response), repeat)
+
+    results["format_usd"] = per_call(lambda: format_usd(64123.45), repeat)
+    for size in sizes:
+        results[f"frame[{size}]"] += results["format_usd"]
+
+    return {name: round(value, 1) for name, value in results.items()}
+
+
+def compare(results, baseline, threshold):
+    # everything slower than the baseline by more than threshold
+    regressions = {}
+    for name, value in results.items():
+        before = baseline.get(name)
+        if before and value > before * (1 + threshold):
+            regressions[name] = {
+                "baseline_ns": before,
+                "ns": value,
+                "change": f"{(value / before - 1) * 100:+.0f}%",
+            }
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="data layer microbenchmarks")
+    parser.add_argument(
+        "--sizes",
+        default="24,156,1000,10000",
+        help="comma separated forecast lengths in periods",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="json baseline to compare with or save")
+    parser.add_argument(
+        "--save", action="store_true", help="save this run as the baseline"
+    )
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    # exit status 2 so a missing baseline is not mistaken for a regression
+    if args.baseline and not args.save and not os.path.exists(args.baseline):
+        print(
+            f"no baseline at {args.baseline}, make one with --baseline "
+            f"{args.baseline} --save",
+            file=sys.stderr,
+        )
+        sys.exit(2)
+
+    # keep what the sources print out of the report and out of the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run(load_settings(), sizes, max(1, args.repeat))
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results_ns": results,
+    }
+
+    regressions = {}
+    if args.baseline and args.save:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=4)
+    elif args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline["results_ns"], args.threshold)
+        report["threshold"] = args.threshold
+        report["regressions"] = regressions
+
+    print(json.dumps(report, indent=4))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# compact records for the parts of the NOAA responses we actually show
+#
+# the api hands back deeply nested json with far more in it than the screen
+# uses. we project each response into small __slots__ records as soon as it
+# arrives and let the raw payload go, so the process is not carrying around
+# a few hundred kilobytes of dicts, and reading a field is an attribute
+# lookup rather than a walk down ["properties"]["periods"][i][...].
+#
+# records turn into plain lists (to_list) and back (from_list) for the warm
+# start snapshot, the points cache and the collector process.
+#
+# each source publishes everything it knows as one frozen object (Forecast,
+# Weather, Ticker) and swaps it in with a single assignment. the render loop
+# grabs the current object once per draw, so it never sees half of one fetch
+# and half of the next, and never needs a lock.
+#
+# orjson is used to decode responses when it is installed. it is optional,
+# the standard json module works just as well, only slower.
+
+
+import json
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+import interpolation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    # decode a response body, bytes or str
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def timestamp(iso_time):
+    # 2024-04-23T19:00:00-04:00 -> unix time
+    return datetime.fromisoformat(iso_time).timestamp()
+
+
+def fahrenheit(quantity):
+    # a {"unitCode": "wmoUnit:degC", "value": 5.0} quantity in fahrenheit
+    if not quantity or quantity.get("value") is None:
+        return None
+    if quantity.get("unitCode", "").endswith("degC"):
+        return quantity["value"] * 9 / 5 + 32
+    return quantity["value"]
+
+
+class Record:
+    __slots__ = ()
+
+    def to_list(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values):
+        # lists saved before a field was added get None for it
+        record = cls.__new__(cls)
+        for i, field in enumerate(cls.__slots__):
+            setattr(record, field, values[i] if i < len(values) else None)
+        return record
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_list() == other.to_list()
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in self.__slots__
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class Points(Record):
+    # where the forecasts for a lat/lon live
+    __slots__ = ("forecast_url", "forecast_hourly_url", "city", "state")
+
+    def __init__(self, data):
+        properties = data["properties"]
+        self.forecast_url = properties["forecast"]
+        self.forecast_hourly_url = properties["forecastHourly"]
+
+        location = properties.get("relativeLocation", {}).get("properties", {})
+        self.city = location.get("city", "")
+        self.state = location.get("state", "")
+
+
+class ForecastPeriod(Record):
+    # one half day of the 7 day forecast
+    __slots__ = (
+        "name",
+        "end_time",
+        "temperature",
+        "short_forecast",
+        "detailed_forecast",
+    )
+
+    def __init__(self, period):
+        self.name = period["name"]
+        self.end_time = timestamp(period["endTime"])
+        self.temperature = period["temperature"]
+        self.short_forecast = period["shortForecast"]
+        self.detailed_forecast = period["detailedForecast"]
+
+
+class HourlyPeriod(Record):
+    # one hour of the hourly forecast
+    __slots__ = (
+        "end_time",
+        "temperature",
+        "rain_chance",
+        "humidity",
+        "wind_speed",
+        "wind_direction",
+        "short_forecast",
+        "dewpoint",
+    )
+
+    def __init__(self, period):
+        self.end_time = timestamp(period["endTime"])
+        self.temperature = period["temperature"]
+        self.rain_chance = period["probabilityOfPrecipitation"]["value"]
+        self.humidity = period["relativeHumidity"]["value"]
+        self.wind_speed = period["windSpeed"]
+        self.wind_direction = period["windDirection"]
+        self.short_forecast = period["shortForecast"]
+        self.dewpoint = fahrenheit(period.get("dewpoint"))
+
+
+def forecast_periods(data):
+    return [ForecastPeriod(period) for period in data["properties"]["periods"]]
+
+
+def hourly_periods(data):
+    return [HourlyPeriod(period) for period in data["properties"]["periods"]]
+
+
+class HourlyIndex:
+    # a compact index over the hourly forecast built once per fetch. the end
+    # times are sorted so finding the active period is a single bisect and
+    # the parallel tuples can be sliced without touching the records again.
+    # curves gives smooth values between the hours, see interpolation.py
+
+    def __init__(self, periods, method=interpolation.CUBIC):
+        self.periods = tuple(periods)
+        self.end_times = tuple(period.end_time for period in periods)
+        self.temperatures = tuple(period.temperature for period in periods)
+        self.rain_chances = tuple(period.rain_chance for period in periods)
+        self.curves = interpolation.ForecastCurves(self.periods, method)
+
+    def first_active(self, current_time=None):
+        # index of the first period that has not ended yet
+        if current_time is None:
+            current_time = time.time()
+        return bisect_right(self.end_times, current_time)
+
+
+class Frozen:
+    # a read only bundle of values. build a new one with replace() rather
+    # than changing one in place
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            object.__setattr__(self, field, values[field])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read only")
+
+    def replace(self, **changes):
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+    # plain json for the warm start snapshot and the collector process.
+    # fetched_at and version travel alongside the state
+
+    def to_state(self):
+        return {
+            field: getattr(self, field)
+            for field in self.__slots__
+            if field not in ("fetched_at", "version")
+        }
+
+    @classmethod
+    def from_state(cls, state, fetched_at, version):
+        return cls(fetched_at=fetched_at, version=version, **state)
+
+
+class Forecast(Frozen):
+    # everything NOAA knows after a fetch
+    __slots__ = ("points", "forecast", "hourly_index", "fetched_at", "version")
+
+    def to_state(self):
+        # points and the hourly index are None until we have fetched them
+        return {
+            "points": None if self.points is None else self.points.to_list(),
+            "forecast": [period.to_list() for period in self.forecast],
+            "hourly": (
+                None
+                if self.hourly_index is None
+                else [period.to_list() for period in self.hourly_index.periods]
+            ),
+        }
+
+    @classmethod
+    def from_state(cls, state, fetched_at, version):
+        points, hourly = state["points"], state["hourly"]
+        return cls(
+            points=None if points is None else Points.from_list(points),
+            forecast=tuple(
+                ForecastPeriod.from_list(values) for values in state["forecast"]
+            ),
+            hourly_index=(
+                None
+                if hourly is None
+                else HourlyIndex([HourlyPeriod.from_list(values) for values in hourly])
+            ),
+            fetched_at=fetched_at,
+            version=version,
+        )
+
+    def short_forecast(self):
+        if self.forecast:
+            return self.forecast[0].short_forecast
+        else:
+            return "No Data"
+
+    def active_periods(self):
+        index = self.hourly_index
+        if index is None:
+            return ()
+
+        # reject any data that is before the current time
+        return index.periods[index.first_active() :]
+
+    def current_hourly(self):
+        # an old snapshot can have run out of periods entirely
+        periods = self.active_periods()
+        if periods:
+            return periods[0]
+        else:
+            return "No Data"
+
+    def hourly_rain_chances(self):
+        index = self.hourly_index
+        if index is None:
+            return ()
+        return index.rain_chances[index.first_active() :]
+
+    def hourly_temperatures(self):
+        index = self.hourly_index
+        if index is None:
+            return ()
+        return index.temperatures[index.first_active() :]
+
+    def sample(self, field, current_time=None):
+        # temperature, dewpoint, humidity, wind_speed or rain_chance at any
+        # moment, between the hourly values. None without a forecast
+        index = self.hourly_index
+        if index is None:
+            return None
+        if current_time is None:
+            current_time = time.time()
+        return index.curves.sample(field, current_time)
+
+
+class Weather(Frozen):
+    # current conditions from openweathermap, temperatures in fahrenheit and
+    # speeds in mph
+    __slots__ = (
+        "current_temperature",
+        "current_feels_like",
+        "current_pressure",
+        "current_humidity",
+        "weather_description",
+        "wind_speed",
+        "wind_gust",
+        "wind_direction",
+        "visibility",
+        "sunrise",
+        "sunset",
+        "fetched_at",
+        "version",
+    )
+
+
+class Ticker(Frozen):
+    # the btc price, the price before it and the 24h change, plus the rolling
+    # stats and sparkline from ticks.TickHistory as of the last recorded tick.
+    # a composite from aggregator.py also has {name: [price, fetched_at]} for
+    # every exchange that went into it
+    __slots__ = (
+        "btc_usd",
+        "last_btc_usd",
+        "pct_chg",
+        "stats",
+        "sparkline",
+        "sources",
+        "fetched_at",
+        "version",
+    )
+
+    @classmethod
+    def from_state(cls, state, fetched_at, version):
+        # snapshots from before the history and the aggregator have none of
+        # these
+        state = dict(state)
+        state["stats"] = state.get("stats", {})
+        state["sparkline"] = tuple(state.get("sparkline", ()))
+        state["sources"] = state.get("sources", {})
+        return cls(fetched_at=fetched_at, version=version, **state)
+
+
+EMPTY_FORECAST = Forecast(
+    points=None, forecast=(), hourly_index=None, fetched_at=0, version=0
+)
+
+EMPTY_WEATHER = Weather(
+    current_temperature=0,
+    current_feels_like=0,
+    current_pressure=0,
+    current_humidity=0,
+    weather_description="",
+    wind_speed=0,
+    wind_gust=0,
+    wind_direction=0,
+    visibility=0,
+    sunrise=0,
+    sunset=0,
+    fetched_at=0,
+    version=0,
+)
+
+EMPTY_TICKER = Ticker(
+    btc_usd=0,
+    last_btc_usd=0,
+    pct_chg="-0%",
+    stats={},
+    sparkline=(),
+    sources={},
+    fetched_at=0,
+    version=0,
+)
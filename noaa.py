@@ -11,9 +11,76 @@
 # let's all play nice in the sandbox and not spam too much :)
 
 
-import requests
+import os
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from archive import ResponseArchive
+import resilience
+from http_client import client, stretch_interval
+
+# settings can point us somewhere else, like stub_server.py
+BASE_URL = "https://api.weather.gov"
+
+
+class PointsCache:
+    # the /points lookup only maps a lat/lon to the grid office and forecast
+    # urls, which practically never change, so keep it on disk between runs
+    # instead of paying a round trip for it on every update
+    def __init__(
+        self, path="noaa-points-cache.json", ttl=7 * 24 * 60 * 60, base_url=BASE_URL
+    ):
+        self.path = path
+        self.ttl = ttl
+
+        # grid urls from a stub server are kept apart from the real ones
+        self.scope = "" if base_url == BASE_URL else f"{base_url} "
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def key(self, lat, lon):
+        return f"{self.scope}{lat},{lon}"
+
+    def get(self, lat, lon):
+        with self.lock:
+            entry = self.entries.get(self.key(lat, lon))
+        if entry is None or "points" not in entry:
+            return None
+        if time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        return models.Points.from_list(entry["points"])
+
+    def put(self, lat, lon, points):
+        with self.lock:
+            self.entries[self.key(lat, lon)] = {
+                "fetched_at": time.time(),
+                "points": points.to_list(),
+            }
+            self.__save()
+
+    def forget(self, lat, lon):
+        with self.lock:
+            if self.entries.pop(self.key(lat, lon), None) is not None:
+                self.__save()
+
+    def __save(self):
+        # write then rename so a crash never leaves half a file behind
+        try:
+            with open(self.path + ".tmp", "w") as file:
+                json.dump(self.entries, file)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            print(f"Could not save {self.path}: {e}")
 
 
 class NOAA:
@@ -24,10 +91,12 @@ class NOAA:
         lat=None,
         lon=None,
         logging_enabled=False,
+        settings=None,
     ):
 
-        with open("settings.json") as json_file:
-            settings = json.load(json_file)
+        if settings is None:
+            with open("settings.json") as json_file:
+                settings = json.load(json_file)
 
         if lat is None:
             self.lat = settings["weather_lat"]
@@ -41,11 +110,47 @@ class NOAA:
 
         self.state = settings["weather_state"]
 
+        # stretch the cooldown to match the server's Cache-Control
+        self.respect_cache_control = bool(settings.get("respect_cache_control", False))
+        self.max_age = None
+
+        self.base_url = settings.get("noaa_base_url", BASE_URL).rstrip("/")
+
+        # the points lookup is cached on disk for a week by default
+        self.points_cache = PointsCache(
+            settings.get("noaa_points_cache_file", "noaa-points-cache.json"),
+            ttl=float(settings.get("noaa_points_cache_hours", 168)) * 60 * 60,
+            base_url=self.base_url,
+        )
+
+        # timeouts, retries and a circuit breaker for api.weather.gov
+        self.policy = resilience.FetchPolicy(settings)
+        self.breaker = resilience.breaker("noaa", settings)
+
+        # the two forecasts are fetched side by side
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
         self.cooldown = int(cooldown)
         self.verbose_enabled = bool(verbose_enabled)
         self.logging_enabled = bool(logging_enabled)
 
+        # with logging on every response we fetch is kept in a rotating
+        # compressed archive, see archive.py
+        self.archive = None
+        if self.logging_enabled:
+            self.archive = ResponseArchive(
+                settings.get("archive_directory", "archive"),
+                "noaa",
+                max_bytes=int(float(settings.get("archive_max_mb", 8)) * (1 << 20)),
+                keep=settings.get("archive_keep", 5),
+            )
+
+        # everything we know, parsed into the records in models.py and
+        # replaced as a whole on every fetch. the raw json is not kept
+        self.data = models.EMPTY_FORECAST
+
         self.last_update = 0
+        self.incomplete = False
         if self.cooldown < 1:
             self.cooldown = 1
 
@@ -55,163 +160,195 @@ class NOAA:
             self.verbose("Rate limited, skipping update")
             return
 
-        # record the timestamp of the new rate limit.
-        self.last_update = time.time()
-
         self.verbose("Updating NOAA data")
-        url = f"https://api.weather.gov/points/{self.lat},{self.lon}"
-        response = requests.get(url)
-        if response.status_code != 200:
-            self.verbose(f"Failed to get NOAA data: {response.status_code}")
-            return
-
-        self.points_data = response.json()
 
-        # pretty print the data
-        self.verbose(json.dumps(self.points_data, indent=4))
-
-        # get the forecast urls
-        forecast_url = self.points_data["properties"]["forecast"]
-        forecast_hourly_url = self.points_data["properties"]["forecastHourly"]
-
-        # get the forecast data
-        response = requests.get(forecast_url)
-        if response.status_code != 200:
-            self.verbose(f"Failed to get forecast data: {response.status_code}")
+        # until we have everything, poll_interval asks to be tried again soon
+        self.incomplete = True
+
+        # the grid urls come from the points cache when we have them
+        points = self.points_cache.get(self.lat, self.lon)
+        if points is None:
+            url = f"{self.base_url}/points/{self.lat},{self.lon}"
+            status, points, _ = self.__fetch(url, False, "noaa-point", models.Points)
+            if status != 200:
+                return
+            self.points_cache.put(self.lat, self.lon, points)
+
+        # get the forecast and forecast hourly data at the same time
+        forecast = self.executor.submit(
+            self.__fetch,
+            points.forecast_url,
+            bool(self.data.forecast),
+            "noaa-forecast",
+            models.forecast_periods,
+        )
+        if not self.breaker.closed():
+            # a half open breaker lets a single probe through, so let the
+            # forecast close it before asking for the hourly forecast
+            forecast.result()
+        forecast_hourly = self.executor.submit(
+            self.__fetch,
+            points.forecast_hourly_url,
+            self.data.hourly_index is not None,
+            "noaa-forecast-hourly",
+            models.hourly_periods,
+        )
+        status, forecast_periods, forecast_age = forecast.result()
+        hourly_status, hourly_periods, hourly_age = forecast_hourly.result()
+
+        # a 404 means the grid moved under us, look the point up again next time
+        if status == 404 or hourly_status == 404:
+            self.verbose("Forecast urls are gone, dropping the cached points")
+            self.points_cache.forget(self.lat, self.lon)
+            self.last_update = 0
             return
 
-        self.forecast_data = response.json()
-
-        # pretty print the forecast data
-        self.verbose(json.dumps(self.forecast_data, indent=4))
-
-        # get the forecast hourly data
-
-        response = requests.get(forecast_hourly_url)
-        if response.status_code != 200:
-            self.verbose(f"Failed to get forecast hourly data: {response.status_code}")
+        if status not in (200, 304) or hourly_status not in (200, 304):
             return
 
-        self.forecast_hourly_data = response.json()
-
-        # pretty print the forecast hourly data
-        self.verbose(json.dumps(self.forecast_hourly_data, indent=4))
+        # record the timestamp of the new rate limit. only once we have
+        # everything, so a failed update is retried as soon as the breaker
+        # allows rather than after a whole cooldown
+        self.last_update = time.time()
+        self.incomplete = False
 
-        if self.logging_enabled:
-            self.__log_data()
+        # poll no faster than the forecasts are said to change
+        max_ages = [age for age in (forecast_age, hourly_age) if age is not None]
+        self.max_age = min(max_ages) if max_ages else None
 
-    def __log_data(self):
-        # write the dumps too noaa-point.json
-        with open("noaa-point.json", "w") as file:
-            json.dump(self.points_data, file, indent=4)
+        points_changed = points != self.data.points
+        if not points_changed and forecast_periods is None and hourly_periods is None:
+            self.verbose("NOAA data not modified")
+            return
 
-        with open("noaa-forecast.json", "w") as file:
-            json.dump(self.forecast_data, file, indent=4)
+        # None keeps what we already have
+        self.__swap(points, forecast_periods, hourly_periods)
+
+    def __fetch(self, url, have_previous, name, parse):
+        # returns (status, records, max_age). records are what parse makes of
+        # the json and are only there on a 200, a 304 means keep what we
+        # parsed last time. status is None if we could not get an answer we
+        # can use at all
+        try:
+            response = resilience.get(url, self.breaker, self.policy, allow=(404,))
+            if response.not_modified and not have_previous:
+                # the validators outlived whatever we parsed from them, ask
+                # again for the whole thing
+                response = resilience.get(
+                    url, self.breaker, self.policy, allow=(404,), conditional=False
+                )
+        except resilience.FetchError as e:
+            print(f"Failed to get {name}: {e}")
+            return None, None, None
 
-        with open("noaa-forecast-hourly.json", "w") as file:
-            json.dump(self.forecast_hourly_data, file, indent=4)
+        if response.not_modified:
+            if have_previous:
+                return response.status_code, None, response.max_age
+            print(f"Failed to get {name}: 304 with nothing to keep")
+            client.forget(url)
+            return None, None, None
 
-    def verbose(self, str: str):
+        if response.status_code != 200:
+            self.verbose(f"Failed to get {name}: {response.status_code}")
+            client.forget(url)
+            return response.status_code, None, None
+
+        # keep the body exactly as it arrived, the archive writes it to disk
+        # on its own thread
+        if self.archive is not None:
+            self.archive.record(name, url, response.content)
+
+        # project into records and let the raw json go. if that fails the
+        # validators go too, a 304 next time would leave us with nothing
+        try:
+            data = models.loads(response.content)
+            records = parse(data)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Failed to parse {name}: {e!r}")
+            client.forget(url)
+            return None, None, None
+
+        # pretty print the data, but only build the string if we will print it
+        self.verbose(lambda: json.dumps(data, indent=4))
+
+        return response.status_code, records, response.max_age
+
+    def poll_interval(self):
+        if self.breaker.failing() or self.incomplete:
+            return self.breaker.retry_delay(self.cooldown, self.policy)
+        return stretch_interval(self.cooldown, self.max_age, self.respect_cache_control)
+
+    def publish(self, points_data, forecast_data, forecast_hourly_data):
+        # swap in a complete set of responses. also used to feed recorded
+        # fixtures in without touching the network
+        self.__swap(
+            models.Points(points_data),
+            models.forecast_periods(forecast_data),
+            models.hourly_periods(forecast_hourly_data),
+        )
+
+    def __swap(self, points, forecast, hourly_periods):
+        # build the new data off to the side and publish it with a single
+        # assignment so readers always see one complete fetch
+        data = self.data
+        changes = {"points": points}
+        if forecast is not None:
+            changes["forecast"] = tuple(forecast)
+        if hourly_periods is not None:
+            changes["hourly_index"] = models.HourlyIndex(hourly_periods)
+
+        self.data = data.replace(
+            fetched_at=time.time(), version=data.version + 1, **changes
+        )
+
+    def restore(self, state, fetched_at):
+        self.data = models.Forecast.from_state(state, fetched_at, self.data.version + 1)
+
+    def verbose(self, message):
+        # message can be a callable so expensive messages are only built
+        # when they will actually be printed
         if self.verbose_enabled:
-            print(str)
+            if callable(message):
+                message = message()
+            print(message)
+
+    # the getters below read whatever data is current. anything drawing more
+    # than one value should take self.data once and use its methods instead
 
     def get_short_forecast(self):
-        if self.forecast_data is not None:
-            return self.forecast_data["properties"]["periods"][0]["shortForecast"]
-        else:
-            return "No Data"
+        return self.data.short_forecast()
 
     def get_current_hourly_forecast(self):
-        if self.forecast_hourly_data is not None:
-            return self.get_active_periods()[0]
-        else:
-            return "No Data"
+        return self.data.current_hourly()
 
     def get_instantaneous_temperature(self):
-        if self.forecast_hourly_data is not None:
-
-            # extract the minutes and seconds of the current time
-            current_time = time.localtime()
-            fractional_seconds = time.time() % 1
-
-            seconds_into_hour = (
-                current_time.tm_sec + current_time.tm_min * 60 + fractional_seconds
-            )
-            hour_progress = seconds_into_hour / (60 * 60)
-
-            # get the temperature for this hour and next hour
-            temperatures = self.get_hourly_temperatures()
-
-            t1 = temperatures[0]
-            t2 = temperatures[1]
-
-            # linear interpolation
-            ti = t1 + (t2 - t1) * hour_progress
-
-            return ti
-
-        else:
+        # smoothly between the hourly temperatures, from a curve built once
+        # per fetch. see interpolation.py
+        temperature = self.data.sample("temperature")
+        if temperature is None:
             return 0
+        return temperature
 
     def get_active_periods(self):
-
-        active_periods = []
-
-        if self.forecast_hourly_data is not None:
-
-            # reject any data that is before the current time
-            current_time = time.time()
-
-            for period in self.forecast_hourly_data["properties"]["periods"]:
-                # look at when this hour ends
-                end_time = period["endTime"]
-
-                # end time is in the following format 2024-04-23T19:00:00-04:00
-                # we need to convert this to unix time
-
-                end_time_unix = time.mktime(
-                    time.strptime(end_time, "%Y-%m-%dT%H:%M:%S%z")
-                )
-
-                if current_time < end_time_unix:
-                    active_periods.append(period)
-
-        return active_periods
+        return self.data.active_periods()
 
     def get_hourly_rain_chances(self):
-
-        hourly_rain_chances = []
-
-        active_periods = self.get_active_periods()
-
-        for period in active_periods:
-            hourly_rain_chances.append(period["probabilityOfPrecipitation"]["value"])
-
-        return hourly_rain_chances
+        return self.data.hourly_rain_chances()
 
     def get_hourly_temperatures(self):
-
-        hourly_temps = []
-
-        active_periods = self.get_active_periods()
-
-        for period in active_periods:
-            hourly_temps.append(period["temperature"])
-
-        return hourly_temps
+        return self.data.hourly_temperatures()
 
 
 if __name__ == "__main__":
     noaa = NOAA(verbose_enabled=True, logging_enabled=True)
     noaa.update()
+    noaa.archive.flush()
     print("Current Weather Conditions ")
-    print(noaa.forecast_data["properties"]["periods"][0]["detailedForecast"])
+    print(noaa.data.forecast[0].detailed_forecast)
     print("Hourly Forecast")
 
-    # for period in noaa.forecast_hourly_data["properties"]["periods"]:
-    #     print(
-    #         f"{period['startTime']} to {period['endTime']} {period['temperature']}F {period['shortForecast']}"
-    #     )
+    # for period in noaa.data.hourly_index.periods:
+    #     print(f"{period.end_time} {period.temperature}F {period.short_forecast}")
     # # loop through the periods
 
     # print(noaa.get_hourly_temperatures())
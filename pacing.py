@@ -0,0 +1,78 @@
+# decides when the next frame should be drawn
+#
+# in "fixed" mode we just tick at settings["fps"] like we always have.
+#
+# in "adaptive" mode we work out the next instant anything on screen can
+# change: the next hundredth, tenth or second depending on what we show, and
+# block in pygame.event.wait until then. the fetch scheduler posts a
+# DATA_ARRIVED event when a source finishes so new data still shows up right
+# away, and input still wakes us so we can quit. each display mode also has a
+# frame rate cap so a laptop server is not burning a core on a screensaver.
+
+
+import math
+import time
+
+import pygame
+
+DATA_ARRIVED = pygame.event.custom_type()
+
+# how often the screen can change for each tenths_or_hundredths setting
+RESOLUTIONS = {
+    "hundredths": 0.01,
+    "tenths": 0.1,
+    "seconds": 1,
+}
+
+DEFAULT_CAPS = {
+    "hundredths": 60,
+    "tenths": 10,
+    "seconds": 1,
+}
+
+
+def post_data_arrived(name):
+    # called from fetch worker threads. the event queue is thread safe but
+    # may not exist yet if pygame is not up
+    try:
+        pygame.event.post(pygame.event.Event(DATA_ARRIVED, source=name))
+    except pygame.error:
+        pass
+
+
+class FramePacer:
+    def __init__(self, settings):
+        self.mode = settings.get("pacing", "fixed")
+        self.fps = settings["fps"]
+        self.clock = pygame.time.Clock()
+
+        display = settings["tenths_or_hundredths"]
+        caps = dict(DEFAULT_CAPS)
+        caps["hundredths"] = self.fps
+        caps.update(settings.get("adaptive_fps_caps", {}))
+
+        # never draw faster than the display can change or than the cap
+        self.interval = max(
+            RESOLUTIONS.get(display, 0.01), 1 / float(caps.get(display, self.fps))
+        )
+
+    def wait(self):
+        # sleeps until the next frame is due and returns any events that came
+        # in while we were waiting
+        if self.mode != "adaptive":
+            self.clock.tick(self.fps)
+            return pygame.event.get()
+
+        # line frames up with the boundaries the display changes on so the
+        # digits flip as close to on time as possible
+        current_time = time.time()
+        next_frame = (math.floor(current_time / self.interval) + 1) * self.interval
+        timeout = math.ceil((next_frame - current_time) * 1000)
+
+        events = []
+        if timeout > 0:
+            event = pygame.event.wait(timeout)
+            if event.type != pygame.NOEVENT:
+                events.append(event)
+
+        return events + pygame.event.get()
@@ -0,0 +1,94 @@
+# the 24 hour forecast curves drawn behind everything else
+#
+# the points for each curve are worked out in one pass and drawn with a single
+# pygame.draw.lines call onto an off-screen surface. that surface only gets
+# rebuilt when the forecast or the screen size changes and is otherwise just
+# the compositor's background, so each frame costs one blit at most.
+#
+# the btc sparkline is drawn the same way, in white on a transparent surface
+# so it can be tinted like the labels.
+
+
+import pygame
+
+
+def plot_points(data, screen_size, custom_max=None, custom_min=None):
+    # the api sends null for some values, treat those as zero
+    data = [0 if value is None else value for value in data]
+
+    # get the min and max of the range we are plotting
+    if custom_max is not None:
+        max_range = custom_max
+    else:
+        max_range = max(data)
+
+    if custom_min is not None:
+        min_range = custom_min
+    else:
+        min_range = min(data)
+
+    if max_range <= min_range:
+        max_range = min_range + 1
+
+    width, height = screen_size
+    # a fractional step so the points always span the whole width
+    step = width / max(len(data) - 1, 1)
+    scale = height / (max_range - min_range)
+
+    return [
+        (i * step, height - (value - min_range) * scale) for i, value in enumerate(data)
+    ]
+
+
+def plot_line(
+    data, screen_size, surface, color, thickness, custom_max=None, custom_min=None
+):
+    if len(data) < 2:
+        return
+
+    points = plot_points(data, screen_size, custom_max, custom_min)
+
+    pygame.draw.lines(surface, color, False, points, thickness)
+
+    # draw a small circle at each point
+    for point in points:
+        pygame.draw.circle(surface, color, point, thickness * 3)
+
+
+def forecast_background(screen_size, hourly_temperatures, hourly_rain_chances):
+    background = pygame.Surface(screen_size)
+    background.fill((0, 0, 0))
+
+    plot_line(
+        hourly_temperatures,
+        screen_size=screen_size,
+        surface=background,
+        color=(255, 0, 0),
+        thickness=2,
+    )
+
+    plot_line(
+        hourly_rain_chances,
+        screen_size=screen_size,
+        surface=background,
+        color=(0, 0, 255),
+        thickness=2,
+        custom_max=100,
+        custom_min=0,
+    )
+
+    return background
+
+
+def sparkline(values, size, thickness=2):
+    surface = pygame.Surface(size, pygame.SRCALPHA)
+    if len(values) < 2:
+        return surface
+
+    # keep the line inside the surface on every side
+    width, height = size
+    points = plot_points(values, (width - 1, height - thickness))
+    points = [(x, y + thickness / 2) for x, y in points]
+
+    pygame.draw.lines(surface, (255, 255, 255), False, points, thickness)
+    return surface
@@ -0,0 +1,69 @@
+# optional per stage timing for the render loop
+#
+# the hot paths wrap themselves in stage("text"), stage("blit") and so on.
+# normally nothing is recording and stage() hands back a shared do nothing
+# context. the benchmark installs a StageTimer to find out where each frame's
+# time goes. stages can nest, and the time is only counted against the
+# innermost stage, so the totals add up to the time spent in stages.
+
+
+import time
+from contextlib import nullcontext
+
+NOT_RECORDING = nullcontext()
+
+recorder = None
+
+
+class Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.enter(self.name)
+
+    def __exit__(self, *exc):
+        self.timer.exit()
+
+
+class StageTimer:
+    def __init__(self):
+        self.totals = {}
+        self.stack = []
+        self.started = 0
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            parent = self.stack[-1]
+            self.totals[parent] = self.totals.get(parent, 0) + now - self.started
+        self.stack.append(name)
+        self.started = now
+
+    def exit(self):
+        now = time.perf_counter()
+        name = self.stack.pop()
+        self.totals[name] = self.totals.get(name, 0) + now - self.started
+        self.started = now
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def take(self):
+        # hand back the totals recorded since the last take and start over
+        totals = self.totals
+        self.totals = {}
+        return totals
+
+
+def stage(name):
+    if recorder is None:
+        return NOT_RECORDING
+    return recorder.stage(name)
+
+
+def record(timer):
+    # install a StageTimer, or None to stop recording
+    global recorder
+    recorder = timer
@@ -0,0 +1,176 @@
+# caches rendered text so we are not re-rasterizing every label every frame
+#
+# font_color is animated, but it only moves a whole step on some frames (and
+# once a second with color_step_seconds). so labels are cached already in
+# color, keyed on the color rounded to whole numbers: while the text and the
+# color hold still a label costs a dictionary lookup, and when either moves
+# it is rendered straight through freetype in the new color. tinting a white
+# copy instead means copying and multiplying every pixel of the label, which
+# is several times slower than freetype at our font sizes.
+#
+# the clock changes every frame so it is built out of a glyph atlas instead.
+
+
+from collections import OrderedDict
+
+import pygame
+
+from profiling import stage
+
+WHITE = (255, 255, 255)
+
+
+def rgb(color):
+    # the animated color is fractional, surfaces only take whole numbers
+    return (int(color[0]), int(color[1]), int(color[2]))
+
+
+def tint(surface, color):
+    # multiply a white surface by color, leaving the alpha channel untouched
+    tinted = surface.copy()
+    tinted.fill(rgb(color), special_flags=pygame.BLEND_RGB_MULT)
+    return tinted
+
+
+class LabelCache:
+    def __init__(self, max_entries=64):
+        self.max_entries = max(1, int(max_entries))
+
+        # white labels for measuring, and labels in the colors we drew them in
+        self.entries = OrderedDict()
+        self.colored = OrderedDict()
+
+    def white(self, font, text):
+        return self.__get(self.entries, (font, text, WHITE))
+
+    def render(self, font, text, color):
+        with stage("text"):
+            return self.__get(self.colored, (font, text, rgb(color)))
+
+    def __get(self, entries, key):
+        surface = entries.get(key)
+        if surface is not None:
+            # mark as most recently used
+            entries.move_to_end(key)
+            return surface
+
+        font, text, color = key
+        surface = font.render(text, True, color)
+        entries[key] = surface
+
+        # evict the least recently used labels so memory stays bounded
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+        return surface
+
+    def clear(self):
+        self.entries.clear()
+        self.colored.clear()
+
+
+# everything the clock, hundredths and am/pm can contain
+ATLAS_CHARACTERS = "0123456789: APM"
+
+
+class GlyphAtlas:
+    # pre-rendered white glyphs for a single font so the clock can be built
+    # from a handful of small blits instead of a full render every frame.
+    # every digit shares the advance of the widest digit so the clock is the
+    # same width no matter what time it is.
+
+    def __init__(self, font, characters=ATLAS_CHARACTERS):
+        self.font = font
+        self.glyphs = {}
+        self.advances = {}
+        self.digit_advance = max(font.size(digit)[0] for digit in "0123456789")
+        self.height = font.get_height()
+
+        # the glyphs in the color we are drawing in now, rendered as they are
+        # needed and thrown away when the color moves on
+        self.color = None
+        self.colored = {}
+
+        # one composed surface per layer, drawn over again in place. the
+        # compositor keeps the surface it was given for later redraws, so
+        # two layers can never share one. cells never overlap: digits are
+        # centered in the widest digit's advance, anything else gets its own
+        self.surfaces = {}
+
+        for character in characters:
+            self.glyph(character)
+
+    def glyph(self, character):
+        surface = self.glyphs.get(character)
+        if surface is None:
+            # anything we did not expect (an odd locale's am/pm for example)
+            # gets rendered the first time we see it
+            surface = self.font.render(character, True, WHITE)
+            self.glyphs[character] = surface
+            if character.isdigit():
+                self.advances[character] = self.digit_advance
+            else:
+                self.advances[character] = surface.get_width()
+            self.height = max(self.height, surface.get_height())
+        return surface
+
+    def width(self, text):
+        for character in text:
+            self.glyph(character)
+        return sum(self.advances[character] for character in text)
+
+    def colored_glyph(self, character, color):
+        color = rgb(color)
+        if color != self.color:
+            self.color = color
+            self.colored = {}
+
+        surface = self.colored.get(character)
+        if surface is None:
+            self.glyph(character)
+            surface = self.font.render(character, True, color)
+            self.colored[character] = surface
+        return surface
+
+    def render(self, text, color, layer=None):
+        # text in color. with a layer name the surface is reused the next
+        # time that layer is drawn, so the caller must be done with it by then
+        with stage("text"):
+            return self.__compose(text, color, layer)
+
+    def __compose(self, text, color, layer):
+        color = rgb(color)
+        size = (max(self.width(text), 1), self.height)
+        cells = [self.advances[character] for character in text]
+
+        # a layer's surface is kept with what each cell of it holds, so while
+        # the color holds still only the cells that changed are cleared and
+        # drawn again, usually just the last digit of the seconds. a new
+        # surface is cheaper than clearing every cell when the color moves
+        surface, layout, drawn = self.surfaces.get(layer, (None, None, None))
+        if surface is None or layout != (size, cells, color):
+            surface = pygame.Surface(size, pygame.SRCALPHA)
+            layout, drawn = (size, cells, color), [None] * len(text)
+            if layer is not None:
+                self.surfaces[layer] = (surface, layout, drawn)
+
+        x = 0
+        for i, character in enumerate(text):
+            advance = cells[i]
+            if drawn[i] != character:
+                if drawn[i] is not None:
+                    surface.fill((0, 0, 0, 0), (x, 0, advance, self.height))
+
+                # center each glyph in its cell. the max blend copies the
+                # glyph as is onto the transparent surface instead of
+                # blending it
+                glyph = self.colored_glyph(character, color)
+                surface.blit(
+                    glyph,
+                    (x + (advance - glyph.get_width()) // 2, 0),
+                    special_flags=pygame.BLEND_RGBA_MAX,
+                )
+                drawn[i] = character
+            x += advance
+
+        return surface
@@ -0,0 +1,257 @@
+# how every source talks to the network when things go wrong
+#
+# every request gets a connect and a read timeout so a hung connection can
+# never park a fetch thread forever. connection errors, timeouts, cut off
+# bodies, 429s and 5xx responses are retried a couple of times with
+# exponential backoff and full jitter, so a brief blip does not cost a whole
+# update interval. anything else requests raises fails straight away.
+#
+# each source also has a circuit breaker. after enough failures in a row it
+# opens and requests fail straight away without touching the network. once
+# reset_seconds have passed it lets a single probe through (half open): if
+# that works it closes again, if not it stays open for another round.
+#
+# every breaker counts its state changes and outcomes, see stats().
+#
+# PolledSource is the fetch and poll_interval the single url sources (OWM,
+# CEX and BCI) share on top of all that.
+
+
+import random
+import threading
+import time
+
+import requests
+
+from http_client import client, stretch_interval
+
+# worth another try, the server may well be fine in a moment
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half open"
+
+
+class FetchError(Exception):
+    pass
+
+
+class CircuitOpenError(FetchError):
+    pass
+
+
+class FetchPolicy:
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.connect_timeout = float(settings.get("fetch_connect_timeout", 3.05))
+        self.read_timeout = float(settings.get("fetch_read_timeout", 10))
+        self.retries = max(0, int(settings.get("fetch_retries", 2)))
+        self.backoff = float(settings.get("fetch_backoff_seconds", 0.5))
+        self.max_backoff = float(settings.get("fetch_max_backoff_seconds", 8))
+
+    def delay(self, attempt):
+        # full jitter: anywhere between nothing and the exponential backoff,
+        # so sources that failed together do not all retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, name, settings=None):
+        settings = settings or {}
+        self.name = name
+        self.failure_threshold = max(1, int(settings.get("circuit_failures", 3)))
+        self.reset_seconds = float(settings.get("circuit_reset_seconds", 60))
+
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+        self.counters = {}
+
+    def allow(self):
+        # may we make a request right now?
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.reset_seconds:
+                    self.__count("rejected")
+                    return False
+                self.__move(HALF_OPEN)
+
+            # half open lets exactly one probe through at a time
+            if self.probing:
+                self.__count("rejected")
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.__count("success")
+            self.failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                self.__move(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.__count("failure")
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                if self.state != OPEN:
+                    self.__move(OPEN)
+
+    def failing(self):
+        return self.failures > 0
+
+    def closed(self):
+        return self.state == CLOSED
+
+    def retry_delay(self, interval, policy):
+        # how long a source should wait before trying again after a failure.
+        # sooner than its normal interval, but never sooner than the breaker
+        # will let it through
+        with self.lock:
+            if self.state == OPEN:
+                return max(1, self.reset_seconds - (time.time() - self.opened_at))
+            return min(interval, max(1, policy.delay(self.failures)))
+
+    def __move(self, state):
+        self.__count(f"{self.state} -> {state}")
+        print(f"{self.name} circuit {self.state} -> {state}")
+        self.state = state
+
+    def __count(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def breaker(name, settings=None):
+    # one breaker per source, shared by everything fetching for it
+    with breakers_lock:
+        if name not in breakers:
+            breakers[name] = CircuitBreaker(name, settings)
+        return breakers[name]
+
+
+def stats():
+    with breakers_lock:
+        return {
+            name: {"state": b.state, "failures": b.failures, **b.counters}
+            for name, b in breakers.items()
+        }
+
+
+def get(url, breaker, policy, allow=(), **kwargs):
+    # a GET through the shared http client with timeouts, retries and the
+    # source's breaker. returns the response for 2xx, 304 and any status in
+    # allow, raises FetchError for everything else
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} circuit is open")
+
+    kwargs.setdefault("timeout", (policy.connect_timeout, policy.read_timeout))
+
+    for attempt in range(policy.retries + 1):
+        error = None
+        retry_after = None
+        try:
+            response = client.get(url, **kwargs)
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            error = f"{type(e).__name__}: {e}"
+        except requests.RequestException as e:
+            # a bad url, a redirect loop or a body we cannot decode, trying
+            # again will not help. it still has to count as a failure or a
+            # half open breaker would wait on this probe forever
+            error = f"{type(e).__name__}: {e}"
+            break
+        else:
+            status = response.status_code
+            if status < 400 or status in allow:
+                breaker.record_success()
+                return response
+
+            error = f"HTTP {status}"
+            if status not in RETRY_STATUSES:
+                # the server is up and said no, trying again will not help
+                break
+            retry_after = response.headers.get("Retry-After")
+
+        if attempt < policy.retries:
+            delay = policy.delay(attempt)
+            if retry_after is not None and retry_after.isdigit():
+                delay = min(policy.max_backoff, float(retry_after))
+            time.sleep(delay)
+
+    breaker.record_failure()
+    raise FetchError(f"{url}: {error}")
+
+
+def poll_interval(breaker, policy, interval, max_age, respect_cache_control):
+    # how long a source should wait before its next fetch: soon after a
+    # failure, otherwise its interval stretched to the server's Cache-Control
+    if breaker.failing():
+        return breaker.retry_delay(interval, policy)
+    return stretch_interval(interval, max_age, respect_cache_control)
+
+
+class PolledSource:
+    # for a source with name, data, policy, breaker, update_interval,
+    # last_update, max_age and respect_cache_control
+
+    def poll(self, url):
+        # the json at url, or None if the fetch failed or nothing changed
+        try:
+            response = get(url, self.breaker, self.policy)
+            if response.not_modified and not self.data.fetched_at:
+                # the validators outlived whatever we parsed from them, ask
+                # again for the whole thing
+                response = get(url, self.breaker, self.policy, conditional=False)
+        except FetchError as e:
+            print(f"Failed to get {self.name} data: {e}")
+            return None
+
+        # only now, so a failed fetch is retried without waiting a whole
+        # interval
+        self.last_update = time.time()
+        self.max_age = response.max_age
+
+        if response.not_modified:
+            if not self.data.fetched_at:
+                print(f"Failed to get {self.name} data: 304 with nothing to keep")
+                client.forget(url)
+            # otherwise nothing new since last time
+            return None
+
+        # a body we cannot decode takes its validators with it, a 304 next
+        # time would leave us with nothing
+        try:
+            x = response.json()
+        except ValueError as e:
+            print(f"Failed to parse {self.name} data: {e!r}")
+            client.forget(url)
+            return None
+
+        print(x)
+        return x
+
+    def poll_interval(self):
+        return poll_interval(
+            self.breaker,
+            self.policy,
+            self.update_interval,
+            self.max_age,
+            self.respect_cache_control,
+        )
@@ -0,0 +1,126 @@
+# a long lived scheduler for our data sources
+#
+# rather than spawning a new thread for every source on every frame we keep a
+# priority queue keyed on the next time each source is due and a small pool
+# of worker threads that sleep until something is actually due.
+#
+# a source is only ever in the queue once. it is popped while it runs and put
+# back when it finishes, so two fetches of the same source can never overlap.
+
+
+import heapq
+import threading
+import time
+import traceback
+
+
+class ScheduledSource:
+    def __init__(self, name, update, interval):
+        self.name = name
+        self.update = update
+
+        # interval can be a number of seconds or a callable returning one so
+        # sources can change their interval while we are running
+        self.interval = interval
+
+    def next_interval(self):
+        if callable(self.interval):
+            interval = float(self.interval())
+        else:
+            interval = float(self.interval)
+
+        # never hammer an api more than once a second
+        return max(interval, 1)
+
+
+class FetchScheduler:
+    def __init__(self, workers=2, on_complete=None):
+        self.workers = max(1, int(workers))
+
+        # called from the worker thread with the source name after each run
+        self.on_complete = on_complete
+
+        self.queue = []
+        self.counter = 0
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = False
+
+    def add(self, name, update, interval, delay=0):
+        source = ScheduledSource(name, update, interval)
+        self.__push(source, time.time() + delay)
+        return source
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self.__worker, name=f"fetch-worker-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def __push(self, source, due):
+        with self.condition:
+            # the counter breaks ties so we never compare two sources
+            heapq.heappush(self.queue, (due, self.counter, source))
+            self.counter += 1
+            self.condition.notify()
+
+    def __next_due(self):
+        # must be called holding the condition. blocks until a source is due
+        # and returns it, or returns None once we have been stopped
+        while self.running:
+            if self.queue:
+                wait = self.queue[0][0] - time.time()
+                if wait <= 0:
+                    return heapq.heappop(self.queue)[2]
+            else:
+                wait = None
+            self.condition.wait(wait)
+        return None
+
+    def __worker(self):
+        while True:
+            with self.condition:
+                source = self.__next_due()
+            if source is None:
+                return
+
+            try:
+                source.update()
+            except Exception:
+                print(f"{source.name} update failed")
+                traceback.print_exc()
+
+            if self.on_complete is not None:
+                try:
+                    self.on_complete(source.name)
+                except Exception:
+                    print(f"{source.name} on_complete failed")
+                    traceback.print_exc()
+
+            # schedule from when the fetch finished so the source's own rate
+            # limit check always lets the next run through. a source whose
+            # interval cannot be worked out is tried again in a minute rather
+            # than dropped from the queue
+            try:
+                interval = source.next_interval()
+            except Exception:
+                print(f"{source.name} interval failed")
+                traceback.print_exc()
+                interval = 60
+            self.__push(source, time.time() + interval)
@@ -0,0 +1,76 @@
+# the last good data from each source, kept on disk between runs
+#
+# on boot we load these before the first frame so the screen has something to
+# show straight away, then the scheduler refreshes everything in the
+# background. each source's data turns into plain json (to_state in
+# models.py) and the source can be restored from it, and the data remembers
+# when it was fetched so the ui can tell how old it is.
+
+
+import json
+import os
+import threading
+import time
+
+
+class SnapshotStore:
+    def __init__(self, directory="snapshots"):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+        # the version of each source we last wrote, so a fetch that brought
+        # nothing new does not rewrite the file
+        self.saved_versions = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, name, source):
+        # restore a source from its snapshot. returns False if there was no
+        # usable snapshot
+        path = self.path(name)
+        if not os.path.exists(path):
+            return False
+
+        try:
+            with open(path) as file:
+                snapshot = json.load(file)
+            source.restore(snapshot["state"], snapshot["fetched_at"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring snapshot {path}: {e}")
+            return False
+
+        with self.lock:
+            self.saved_versions[name] = source.data.version
+        return True
+
+    def save(self, name, source):
+        # called after every fetch, from the fetch worker thread
+        data = source.data
+        with self.lock:
+            if data.fetched_at == 0:
+                return
+            if self.saved_versions.get(name) == data.version:
+                return
+            self.saved_versions[name] = data.version
+
+            snapshot = {"fetched_at": data.fetched_at, "state": data.to_state()}
+
+            # write then rename so a crash never leaves half a file behind
+            path = self.path(name)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path + ".tmp", "w") as file:
+                    json.dump(snapshot, file, separators=(",", ":"))
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"Could not save {path}: {e}")
+
+
+def age(data, current_time=None):
+    # seconds since a source's data was fetched, or None if it has none yet
+    if not data.fetched_at:
+        return None
+    if current_time is None:
+        current_time = time.time()
+    return max(0, current_time - data.fetched_at)
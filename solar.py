@@ -0,0 +1,178 @@
+# sunrise, sunset and twilight worked out locally
+#
+# uses NOAA's general solar position equations (the equation of time and the
+# sun's declination from the fractional year, then the hour angle at which
+# the sun crosses a given zenith), good to within a few minutes, all a
+# clock needs. nothing here touches the network.
+#
+# events are grouped by local solar day, the day as the sun at our longitude
+# sees it, so a day's dawn, sunrise, sunset and dusk always fall inside it
+# and the solar day of any moment is one division. a SolarTable works out a
+# year of days at startup, one column per event, and saves them to a cache
+# file so the next start only has to read it. looking up a day is an index
+# into the columns. days outside the table are worked out on the spot.
+#
+# near the poles the sun can stay up or down all day, those events are None.
+
+
+import json
+import math
+import os
+import time
+
+# degrees from straight up at which each event happens. sunrise and sunset
+# allow for refraction and the size of the sun, civil twilight is 6 degrees
+# below the horizon
+DAWN = "dawn"
+SUNRISE = "sunrise"
+SUNSET = "sunset"
+DUSK = "dusk"
+EVENTS = [DAWN, SUNRISE, SUNSET, DUSK]
+ZENITHS = {SUNRISE: 90.833, DAWN: 96.0}
+
+DAY = 24 * 60 * 60
+
+
+def solar_day(t, lon):
+    # the local solar day number of unix time t at longitude lon
+    return int((t + lon * 240) // DAY)
+
+
+def sun_events(day, lat, lon):
+    # {event: unix time or None} for solar day number day
+    noon = time.gmtime(day * DAY + DAY // 2)
+    leap = noon.tm_year % 4 == 0 and (
+        noon.tm_year % 100 != 0 or noon.tm_year % 400 == 0
+    )
+    gamma = 2 * math.pi / (366 if leap else 365) * (noon.tm_yday - 1)
+
+    # minutes the sun runs ahead of or behind the clock, and how far north of
+    # the equator it is, in radians
+    equation_of_time = 229.18 * (
+        0.000075
+        + 0.001868 * math.cos(gamma)
+        - 0.032077 * math.sin(gamma)
+        - 0.014615 * math.cos(2 * gamma)
+        - 0.040849 * math.sin(2 * gamma)
+    )
+    declination = (
+        0.006918
+        - 0.399912 * math.cos(gamma)
+        + 0.070257 * math.sin(gamma)
+        - 0.006758 * math.cos(2 * gamma)
+        + 0.000907 * math.sin(2 * gamma)
+        - 0.002697 * math.cos(3 * gamma)
+        + 0.00148 * math.sin(3 * gamma)
+    )
+
+    latitude = math.radians(lat)
+    events = {}
+    for rising, setting in ((DAWN, DUSK), (SUNRISE, SUNSET)):
+        zenith = math.radians(ZENITHS[rising])
+        cos_hour_angle = math.cos(zenith) / (
+            math.cos(latitude) * math.cos(declination)
+        ) - math.tan(latitude) * math.tan(declination)
+
+        if not -1 <= cos_hour_angle <= 1:
+            # the sun never gets there today
+            events[rising] = events[setting] = None
+            continue
+
+        hour_angle = math.degrees(math.acos(cos_hour_angle))
+        midnight = day * DAY
+        events[rising] = midnight + 60 * (
+            720 - 4 * (lon + hour_angle) - equation_of_time
+        )
+        events[setting] = midnight + 60 * (
+            720 - 4 * (lon - hour_angle) - equation_of_time
+        )
+
+    return events
+
+
+class SolarTable:
+    def __init__(self, lat, lon, start_day, columns):
+        self.lat = lat
+        self.lon = lon
+        self.start_day = start_day
+
+        # {event: [unix time or None for each day from start_day]}
+        self.columns = columns
+        self.days = len(columns[SUNRISE])
+
+    @classmethod
+    def build(cls, lat, lon, start_day, days=366):
+        columns = {event: [] for event in EVENTS}
+        for day in range(start_day, start_day + days):
+            events = sun_events(day, lat, lon)
+            for event in EVENTS:
+                columns[event].append(events[event])
+        return cls(lat, lon, start_day, columns)
+
+    def covers(self, day):
+        return self.start_day <= day < self.start_day + self.days
+
+    def events(self, day):
+        if not self.covers(day):
+            return sun_events(day, self.lat, self.lon)
+        i = day - self.start_day
+        return {event: self.columns[event][i] for event in EVENTS}
+
+    def next_event(self, t, names=(SUNRISE, SUNSET)):
+        # (name, unix time) of the first of names after t, or None if the sun
+        # neither rises nor sets for a while
+        day = solar_day(t, self.lon)
+        for offset in range(3):
+            events = self.events(day + offset)
+            for name in EVENTS:
+                if name in names and events[name] is not None and events[name] > t:
+                    return name, events[name]
+        return None
+
+    def save(self, path):
+        # write then rename so a crash never leaves half a file behind
+        try:
+            with open(path + ".tmp", "w") as file:
+                json.dump(
+                    {
+                        "lat": self.lat,
+                        "lon": self.lon,
+                        "start_day": self.start_day,
+                        "columns": self.columns,
+                    },
+                    file,
+                )
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Could not save {path}: {e}")
+
+
+def load(settings, current_time=None):
+    # this year's table for the configured location, from the cache file if
+    # it is for the same place and still has a few months left in it
+    if current_time is None:
+        current_time = time.time()
+
+    lat = float(settings["weather_lat"])
+    lon = float(settings["weather_lon"])
+    path = settings.get("solar_cache_file", "solar-table.json")
+    today = solar_day(current_time, lon)
+
+    if path and os.path.exists(path):
+        try:
+            with open(path) as file:
+                cached = json.load(file)
+            table = SolarTable(
+                cached["lat"], cached["lon"], cached["start_day"], cached["columns"]
+            )
+            if (table.lat, table.lon) == (lat, lon) and table.covers(today + 90):
+                if table.covers(today - 1):
+                    return table
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring {path}: {e}")
+
+    # start from yesterday so the table is good for just over a year
+    table = SolarTable.build(lat, lon, today - 1)
+    if path:
+        table.save(path)
+    return table
@@ -0,0 +1,175 @@
+# a local stand in for the cex.io websocket feed
+#
+#   python stub_feed.py --port 8765 --rate 20
+#
+# speaks the same protocol cex_stream.py expects: a "connected" greeting,
+# {"e": "subscribe", "rooms": ["tickers"]}, then BTC/USD ticks on a random
+# walk at --rate per second and a {"e": "ping"} every --ping seconds. the
+# ticks carry the time they were sent so the client can measure latency.
+# --drop-after closes every connection after that many ticks and --silent-after
+# stops talking without closing, to exercise reconnects and the heartbeat.
+#
+# point the screensaver at it with "cex_stream_url": "ws://127.0.0.1:8765"
+# or run a quick offline measurement of latency and throughput:
+#
+#   python stub_feed.py --measure 10 --rate 200
+
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import ws
+
+
+class StubFeed:
+    def __init__(self, rate=20, ping=15, price=64000.0, drop_after=0, silent_after=0):
+        self.rate = rate
+        self.ping = ping
+        self.price = price
+        self.drop_after = drop_after
+        self.silent_after = silent_after
+        self.connections = 0
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        return server
+
+    async def handle(self, reader, writer):
+        try:
+            socket = await ws.accept(reader, writer)
+        except (ws.ConnectionClosed, asyncio.IncompleteReadError, ConnectionError):
+            return
+
+        self.connections += 1
+        await socket.send(json.dumps({"e": "connected"}))
+
+        ticker = None
+        try:
+            while True:
+                message = json.loads(await socket.recv())
+                if message.get("e") == "subscribe" and ticker is None:
+                    ticker = asyncio.ensure_future(self.tick(socket))
+        except (ws.ConnectionClosed, ValueError):
+            pass
+        finally:
+            if ticker is not None:
+                ticker.cancel()
+            await socket.close()
+
+    async def tick(self, socket):
+        sent = 0
+        last_ping = time.time()
+        interval = 1 / self.rate
+        next_tick = time.time()
+
+        while True:
+            if self.drop_after and sent >= self.drop_after:
+                await socket.close()
+                return
+            if self.silent_after and sent >= self.silent_after:
+                await asyncio.sleep(3600)
+
+            if time.time() - last_ping >= self.ping:
+                await socket.send(json.dumps({"e": "ping", "time": time.time()}))
+                last_ping = time.time()
+
+            self.price *= 1 + random.gauss(0, 0.0002)
+            spread = 5
+            await socket.send(
+                json.dumps(
+                    {
+                        "e": "tick",
+                        "data": {
+                            "symbol1": "BTC",
+                            "symbol2": "USD",
+                            "price": f"{self.price:.1f}",
+                            "bid": round(self.price - spread / 2, 1),
+                            "ask": round(self.price + spread / 2, 1),
+                            "sent_at": time.time(),
+                        },
+                    }
+                )
+            )
+            sent += 1
+
+            next_tick += interval
+            await asyncio.sleep(max(0, next_tick - time.time()))
+
+
+def serve_in_thread(feed, host="127.0.0.1", port=0):
+    # runs the feed on its own loop and returns the port it is listening on
+    ready = threading.Event()
+    bound = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(feed.serve(host, port))
+        bound["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="stub-feed", daemon=True).start()
+    ready.wait()
+    return bound["port"]
+
+
+def measure(feed, seconds, settings):
+    # a CEX fed only by the stream, against the stub, for a while
+    from cex import CEX
+    from cex_stream import CexStream
+
+    port = serve_in_thread(feed)
+    settings = dict(settings, cex_stream_url=f"ws://127.0.0.1:{port}")
+
+    cex = CEX(settings=settings)
+    stream = CexStream(cex, settings)
+    stream.start()
+    time.sleep(seconds)
+    stream.stop()
+
+    stats = stream.stats()
+    stats["ticks_per_second"] = round(stats["ticks"] / seconds, 1)
+    stats["last_price"] = round(cex.data.btc_usd, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stub cex.io websocket feed")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=20, help="ticks per second")
+    parser.add_argument("--ping", type=float, default=15, help="seconds between pings")
+    parser.add_argument("--drop-after", type=int, default=0)
+    parser.add_argument("--silent-after", type=int, default=0)
+    parser.add_argument(
+        "--measure",
+        type=float,
+        metavar="SECONDS",
+        help="stream from the stub for this long and print latency and throughput",
+    )
+    args = parser.parse_args()
+
+    feed = StubFeed(
+        args.rate, args.ping, drop_after=args.drop_after, silent_after=args.silent_after
+    )
+
+    if args.measure:
+        settings = {"cex_update_minutes": 1, "cex_stream_heartbeat_seconds": 5}
+        print(json.dumps(measure(feed, args.measure, settings), indent=4))
+        return
+
+    async def serve_forever():
+        server = await feed.serve(args.host, args.port)
+        print(f"stub feed on ws://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve_forever())
+
+
+if __name__ == "__main__":
+    main()
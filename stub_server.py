@@ -0,0 +1,366 @@
+# a local stand in for every api the data sources talk to
+#
+#   python stub_server.py --port 8700 [--replay archive/http.log.gz]
+#       [--periods 5000] [--latency 0.2] [--jitter 0.1]
+#       [--error-rate 0.1] [--error-status 503]
+#
+# serves the api.weather.gov, openweathermap, cex.io and blockchain.info
+# endpoints we use. by default the responses are fixtures.py's synthetic
+# ones, --periods makes the hourly forecast as long as you like. --replay
+# serves a recording instead: either what http_client.py wrote with
+# "record_directory" set, with the original headers and timings, or the
+# response archive NOAA keeps with logging on. urls to the real apis inside
+# the responses are pointed back at the stub.
+#
+# every response can be held back by --latency seconds plus up to --jitter
+# more (or by however long the recorded response took, with --latency
+# recorded), and --error-rate of them are answered with --error-status
+# instead. --error-status 0 drops the connection without answering. an
+# If-None-Match matching the response's ETag gets a 304.
+#
+# point the sources at it with the *_base_url settings it prints, or let
+# --measure ROUNDS run the real sources against it and report fetch
+# throughput, parse cost and failures as json.
+
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import archive
+import fixtures
+import models
+
+# where each source normally goes, rewritten to the stub in responses
+UPSTREAMS = {
+    "noaa_base_url": "https://api.weather.gov",
+    "openweathermap_base_url": "https://api.openweathermap.org",
+    "cex_base_url": "https://cex.io",
+    "blockchaininfo_base_url": "https://blockchain.info",
+}
+
+# headers that describe the original transfer rather than the response
+HOP_HEADERS = ("content-length", "content-encoding", "transfer-encoding", "connection")
+
+
+def route(path):
+    # the fixture name for a request path, or None
+    path = path.split("?")[0]
+    if path.startswith("/points/"):
+        return "noaa-point"
+    if path.endswith("/forecast/hourly"):
+        return "noaa-forecast-hourly"
+    if path.endswith("/forecast"):
+        return "noaa-forecast"
+    if path == "/data/2.5/weather":
+        return "owm"
+    if path.startswith("/api/ticker/"):
+        return "cex"
+    if path == "/ticker":
+        return "bci"
+    return None
+
+
+class Response:
+    def __init__(self, body, headers=None, elapsed=0.0, origin=None):
+        self.body = body
+
+        # where a recorded response came from, pointed back at the stub along
+        # with the real apis
+        self.origin = origin
+        self.headers = {
+            name: value
+            for name, value in (headers or {}).items()
+            if name.lower() not in HOP_HEADERS
+        }
+        names = {name.lower(): name for name in self.headers}
+        if "content-type" not in names:
+            self.headers["Content-Type"] = "application/json"
+        self.etag = self.headers.get(names.get("etag"))
+        self.elapsed = elapsed
+
+
+def synthetic(periods=156):
+    return {
+        name: Response(json.dumps(data).encode())
+        for name, data in fixtures.load(periods=periods).items()
+    }
+
+
+def recorded(path):
+    # the newest good response for each endpoint in a recording
+    responses = {}
+    for header, content in archive.read(path):
+        name = header["name"]
+        if route(name) is not None:
+            name = route(name)
+        if name is None or header.get("status", 200) != 200:
+            continue
+        parts = urlsplit(header["url"])
+        responses[name] = Response(
+            content,
+            header.get("headers"),
+            header.get("elapsed", 0.0),
+            f"{parts.scheme}://{parts.netloc}",
+        )
+    return responses
+
+
+class StubServer:
+    def __init__(
+        self,
+        responses,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_status=503,
+    ):
+        self.responses = responses
+
+        # None holds each response back by as long as it took when recorded
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.server = None
+
+    def count(self, name, status):
+        with self.lock:
+            key = f"{name} {status}"
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self, host="127.0.0.1", port=0):
+        # serves from a background thread and returns the base url
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+
+        # send the sources back to us wherever a response names a real api
+        base_url = f"http://{host}:{self.server.server_address[1]}"
+        origins = set(UPSTREAMS.values())
+        origins.update(response.origin for response in self.responses.values())
+        origins.discard(None)
+        for response in self.responses.values():
+            for origin in origins:
+                response.body = response.body.replace(
+                    origin.encode(), base_url.encode()
+                )
+
+        threading.Thread(
+            target=self.server.serve_forever, name="stub-server", daemon=True
+        ).start()
+        return base_url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            # headers and body go out as separate writes, without this the
+            # client's delayed ack costs every keep-alive response 40ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                name = route(self.path)
+                response = stub.responses.get(name)
+                if response is None:
+                    stub.count(name, 404)
+                    self.reply(404, b'{"error": "not stubbed"}')
+                    return
+
+                delay = response.elapsed if stub.latency is None else stub.latency
+                time.sleep(delay + random.uniform(0, stub.jitter))
+
+                if random.random() < stub.error_rate:
+                    stub.count(name, stub.error_status)
+                    if stub.error_status == 0:
+                        self.close_connection = True
+                        return
+                    self.reply(stub.error_status, b'{"error": "stubbed failure"}')
+                    return
+
+                etag = response.etag
+                if etag is not None and self.headers.get("If-None-Match") == etag:
+                    stub.count(name, 304)
+                    self.reply(304, b"", {"ETag": etag})
+                    return
+
+                stub.count(name, 200)
+                self.reply(200, response.body, response.headers)
+
+            def reply(self, status, body, headers=None):
+                self.send_response(status)
+                for header, value in (headers or {}).items():
+                    self.send_header(header, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def stub_settings(base_url):
+    # settings that send every source to the stub
+    return {setting: base_url for setting in UPSTREAMS}
+
+
+def parse_costs(responses, rounds):
+    # milliseconds to decode each response and turn it into records
+    builders = {
+        "noaa-point": models.Points,
+        "noaa-forecast": models.forecast_periods,
+        "noaa-forecast-hourly": lambda data: models.HourlyIndex(
+            models.hourly_periods(data)
+        ),
+    }
+
+    costs = {}
+    for name, response in responses.items():
+        build = builders.get(name, lambda data: data)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            build(models.loads(response.body))
+        costs[name] = {
+            "bytes": len(response.body),
+            "parse_ms": round((time.perf_counter() - started) / rounds * 1000, 3),
+        }
+    return costs
+
+
+def measure(stub, rounds, settings):
+    # run every source against the stub and time it
+    import resilience
+    from blockchaininfo import BCI
+    from cex import CEX
+    from noaa import NOAA
+    from weather import OpenWeatherMap
+
+    base_url = stub.start()
+    directory = tempfile.mkdtemp(prefix="stub-")
+    settings = dict(
+        settings,
+        **stub_settings(base_url),
+        noaa_points_cache_file=os.path.join(directory, "points.json"),
+        noaa_points_cache_hours=0,
+        btc_history_file=None,
+    )
+
+    report = {"base_url": base_url, "rounds": rounds, "sources": {}}
+
+    # the sources print every response, keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        sources = {
+            "noaa": NOAA(settings=settings),
+            "owm": OpenWeatherMap(settings=settings),
+            "cex": CEX(settings=settings),
+            "bci": BCI(settings=settings),
+        }
+
+        for name, source in sources.items():
+            times = []
+            for _ in range(rounds):
+                source.last_update = 0
+                started = time.perf_counter()
+                source.update()
+                times.append(time.perf_counter() - started)
+
+            report["sources"][name] = {
+                "updates_per_second": round(len(times) / sum(times), 1),
+                "p50_ms": round(statistics.median(times) * 1000, 3),
+                "max_ms": round(max(times) * 1000, 3),
+            }
+
+    report["parse"] = parse_costs(stub.responses, rounds)
+    report["requests"] = dict(sorted(stub.counts.items(), key=str))
+    report["circuits"] = resilience.stats()
+
+    stub.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stub server for every data source")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument(
+        "--replay",
+        metavar="ARCHIVE",
+        help="serve a recording instead of synthetic responses",
+    )
+    parser.add_argument(
+        "--periods", type=int, default=156, help="synthetic hourly forecast length"
+    )
+    parser.add_argument(
+        "--latency",
+        default="0",
+        help='seconds before every response, or "recorded" for the recorded time',
+    )
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument(
+        "--measure",
+        type=int,
+        metavar="ROUNDS",
+        help="run the sources against the stub and print timings",
+    )
+    args = parser.parse_args()
+
+    responses = synthetic(args.periods)
+    if args.replay:
+        responses.update(recorded(args.replay))
+
+    stub = StubServer(
+        responses,
+        latency=None if args.latency == "recorded" else float(args.latency),
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+
+    if args.measure:
+        settings = {
+            "weather_lat": "37.0",
+            "weather_lon": "-77.0",
+            "weather_state": "VA",
+            "openweathermap_lat": "37.0",
+            "openweathermap_lon": "-77.0",
+            "openweathermap_api_key": "stub",
+            "openweathermap_update_minutes": 1,
+            "cex_update_minutes": 1,
+            "blockchaininfo_update_minutes": 1,
+        }
+        print(json.dumps(measure(stub, args.measure, settings), indent=4))
+        return
+
+    base_url = stub.start(args.host, args.port)
+    print(f"stub server on {base_url}, for settings.json:")
+    print(json.dumps(stub_settings(base_url), indent=4))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
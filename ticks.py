@@ -0,0 +1,275 @@
+# a fixed size history of btc ticks and rolling statistics over it
+#
+# TickRing keeps (timestamp, bid, ask) for the last capacity ticks in one
+# flat array of doubles, so an append is a few stores and never allocates.
+# given a path it lives in a memory mapped file instead and the history
+# survives a restart. the file is a small header (how many ticks, where the
+# next one goes) followed by the ticks.
+#
+# RollingWindow keeps the min, max, mean and volatility of the mid price over
+# the last hour, day, ... up to date as ticks come in and age out. min and
+# max come from monotonic deques, mean and volatility from running sums, so
+# nothing is ever rescanned. volatility is the realized volatility over the
+# window: the square root of the summed squared log returns, in percent.
+#
+# TickHistory ties the two together for CEX, records at most one tick every
+# btc_history_resolution_seconds so a busy stream does not flood the ring,
+# and keeps a downsampled copy of the longest window for the sparkline.
+
+
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+from collections import deque
+
+HEADER = struct.Struct("<QQQ")
+
+# doubles per tick: timestamp, bid, ask
+FIELDS = 3
+
+
+class TickRing:
+    def __init__(self, capacity, path=None):
+        self.capacity = max(2, int(capacity))
+        self.path = path
+        self.file = None
+        self.map = None
+        self.count = 0
+        self.head = 0
+
+        if path is None:
+            self.values = array("d", bytes(self.capacity * FIELDS * 8))
+        else:
+            self.__open(path)
+
+    def __open(self, path):
+        size = HEADER.size + self.capacity * FIELDS * 8
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.file = open(path, "a+b")
+        existing = os.path.getsize(path)
+        if existing != size:
+            # a different capacity or a damaged file, start over
+            self.file.truncate(0)
+            self.file.truncate(size)
+
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.values = memoryview(self.map)[HEADER.size :].cast("d")
+
+        capacity, count, head = HEADER.unpack_from(self.map)
+        if existing == size and capacity == self.capacity and count <= capacity:
+            self.count = count
+            self.head = head % self.capacity
+        else:
+            HEADER.pack_into(self.map, 0, self.capacity, 0, 0)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, bid, ask):
+        i = self.head * FIELDS
+        values = self.values
+        values[i] = timestamp
+        values[i + 1] = bid
+        values[i + 2] = ask
+
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+        if self.map is not None:
+            HEADER.pack_into(self.map, 0, self.capacity, self.count, self.head)
+
+    def __iter__(self):
+        # oldest first
+        values = self.values
+        start = (self.head - self.count) % self.capacity
+        for n in range(self.count):
+            i = ((start + n) % self.capacity) * FIELDS
+            yield values[i], values[i + 1], values[i + 2]
+
+    def last(self):
+        if not self.count:
+            return None
+        i = ((self.head - 1) % self.capacity) * FIELDS
+        return self.values[i], self.values[i + 1], self.values[i + 2]
+
+    def close(self):
+        if self.map is not None:
+            self.values.release()
+            self.values = None
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+
+class RollingWindow:
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+
+        # never hold more than the ring does
+        self.capacity = capacity
+
+        # (timestamp, mid, squared log return from the tick before)
+        self.ticks = deque()
+        self.lows = deque()
+        self.highs = deque()
+        self.total = 0.0
+        self.squared_returns = 0.0
+
+    def add(self, timestamp, mid):
+        squared_return = 0.0
+        if self.ticks and self.ticks[-1][1] > 0 and mid > 0:
+            squared_return = math.log(mid / self.ticks[-1][1]) ** 2
+
+        self.ticks.append((timestamp, mid, squared_return))
+        self.total += mid
+        self.squared_returns += squared_return
+
+        # lows only ever rise from front to back and highs only ever fall, so
+        # the front of each is the min or max of everything still in view
+        while self.lows and self.lows[-1][1] >= mid:
+            self.lows.pop()
+        self.lows.append((timestamp, mid))
+        while self.highs and self.highs[-1][1] <= mid:
+            self.highs.pop()
+        self.highs.append((timestamp, mid))
+
+        while len(self.ticks) > self.capacity:
+            self.__drop()
+        self.expire(timestamp)
+
+    def expire(self, current_time):
+        cutoff = current_time - self.seconds
+        while self.ticks and self.ticks[0][0] < cutoff:
+            self.__drop()
+
+    def __drop(self):
+        timestamp, mid, squared_return = self.ticks.popleft()
+        self.total -= mid
+
+        # the oldest tick's return was measured from a tick that is already
+        # gone, so the next tick's return leaves the window with it
+        self.squared_returns -= squared_return
+        if self.ticks:
+            first = self.ticks[0]
+            self.squared_returns -= first[2]
+            self.ticks[0] = (first[0], first[1], 0.0)
+
+        if self.lows[0][0] <= timestamp:
+            self.lows.popleft()
+        if self.highs[0][0] <= timestamp:
+            self.highs.popleft()
+
+    def stats(self):
+        if not self.ticks:
+            return None
+        return {
+            "min": self.lows[0][1],
+            "max": self.highs[0][1],
+            "mean": self.total / len(self.ticks),
+            "volatility": math.sqrt(max(0.0, self.squared_returns)) * 100,
+            "ticks": len(self.ticks),
+        }
+
+    def sparkline(self, points, current_time):
+        # the mid price at points evenly spaced times from the start of the
+        # window (or the first tick, while the history is younger than that)
+        # to now, each the last tick at or before that time
+        if not self.ticks:
+            return ()
+
+        start = max(current_time - self.seconds, self.ticks[0][0])
+        step = (current_time - start) / max(1, points - 1)
+
+        values = []
+        ticks = iter(self.ticks)
+        upcoming = next(ticks)
+        last = upcoming[1]
+        for n in range(points):
+            t = start + n * step
+            while upcoming is not None and upcoming[0] <= t:
+                last = upcoming[1]
+                upcoming = next(ticks, None)
+            values.append(last)
+        return tuple(values)
+
+
+class TickHistory:
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.resolution = float(settings.get("btc_history_resolution_seconds", 5))
+        hours = settings.get("btc_history_windows_hours", [1, 24])
+        self.sparkline_points = int(settings.get("btc_sparkline_points", 96))
+
+        # enough room for the longest window at full resolution
+        longest = max(hours) * 60 * 60
+        capacity = int(longest / max(self.resolution, 0.001)) + 1
+        path = settings.get("btc_history_file")
+        try:
+            self.ring = TickRing(capacity, path)
+        except OSError as e:
+            print(f"Keeping btc history in memory, could not map {path}: {e}")
+            self.ring = TickRing(capacity)
+
+        self.windows = {
+            f"{h:g}h": RollingWindow(h * 60 * 60, self.ring.capacity)
+            for h in sorted(hours)
+        }
+        self.longest = self.windows[f"{max(hours):g}h"]
+
+        # pick up where the file left off
+        for timestamp, bid, ask in self.ring:
+            for window in self.windows.values():
+                window.add(timestamp, (bid + ask) / 2)
+
+        self.last_recorded = 0
+        if len(self.ring):
+            self.last_recorded = self.ring.last()[0]
+
+        self.stats = {}
+        self.sparkline = ()
+        self.sparkline_at = 0
+        self.refresh(time.time())
+
+    def add(self, timestamp, bid, ask):
+        # true if the tick made it into the history and the stats moved
+        if timestamp - self.last_recorded < self.resolution:
+            return False
+        self.last_recorded = timestamp
+
+        self.ring.append(timestamp, bid, ask)
+        for window in self.windows.values():
+            window.add(timestamp, (bid + ask) / 2)
+
+        self.refresh(timestamp)
+        return True
+
+    def refresh(self, current_time):
+        for window in self.windows.values():
+            window.expire(current_time)
+        self.stats = {}
+        for name, window in self.windows.items():
+            stats = window.stats()
+            if stats is not None:
+                self.stats[name] = stats
+
+        # walk the whole window for the sparkline only once per point's worth
+        # of time. in between only the newest point moves
+        step = self.longest.seconds / max(1, self.sparkline_points - 1)
+        ticks = self.longest.ticks
+        if current_time - self.sparkline_at >= step or len(self.sparkline) < 2:
+            self.sparkline = self.longest.sparkline(self.sparkline_points, current_time)
+            self.sparkline_at = current_time
+        elif ticks:
+            self.sparkline = self.sparkline[:-1] + (ticks[-1][1],)
+
+    def close(self):
+        self.ring.close()
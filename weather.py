@@ -1,14 +1,22 @@
 import json
-import requests
 import time
 
+import models
+import resilience
 
-class OpenWeatherMap:
-    def __init__(self):
+# settings can point us somewhere else, like stub_server.py
+BASE_URL = "https://api.openweathermap.org"
+
+
+class OpenWeatherMap(resilience.PolledSource):
+    name = "OpenWeatherMap"
+
+    def __init__(self, settings=None):
 
         # load the settings.json into a settings object
-        with open("settings.json") as json_file:
-            settings = json.load(json_file)
+        if settings is None:
+            with open("settings.json") as json_file:
+                settings = json.load(json_file)
 
         lat = settings["openweathermap_lat"]
         lon = settings["openweathermap_lon"]
@@ -17,87 +25,94 @@ class OpenWeatherMap:
         self.lat = lat
         self.lon = lon
         self.key = key
+        self.base_url = settings.get("openweathermap_base_url", BASE_URL).rstrip("/")
         self.update_interval = float(settings["openweathermap_update_minutes"]) * 60
         self.last_update = 0
 
-        self.current_temperature = 0
-        self.current_feels_like = 0
-        self.current_pressure = 0
-        self.current_humidity = 0
-        self.weather_description = ""
-        self.wind_speed = 0
-        self.wind_gust = 0
-        self.wind_direction = 0
-        self.visibility = 0
-        self.sunrise = 0
-        self.sunset = 0
+        # stretch the interval to match the server's Cache-Control
+        self.respect_cache_control = bool(settings.get("respect_cache_control", False))
+        self.max_age = None
+
+        # timeouts, retries and a circuit breaker for openweathermap
+        self.policy = resilience.FetchPolicy(settings)
+        self.breaker = resilience.breaker("owm", settings)
+
+        # the current conditions, replaced as a whole on every fetch so the
+        # render loop never sees half of an update. see models.Weather
+        self.data = models.EMPTY_WEATHER
 
     def update(self):
 
         if time.time() - self.last_update < self.update_interval:
             return
 
-        self.last_update = time.time()
-
         lat = self.lat
         lon = self.lon
         key = self.key
 
-        complete_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={key}"
-        response = requests.get(complete_url)
-        x = response.json()
-        print(x)
-
-        if x["cod"] != "404":
-
-            # store the value of "main"
-            # key in variable y
-            y = x["main"]
-
-            # store the value corresponding
-            # to the "temp" key of y
-            self.current_temperature = self.kelvin_to_fahrenheit(y["temp"])
-            self.current_feels_like = self.kelvin_to_fahrenheit(y["feels_like"])
-
-            # store the value corresponding
-            # to the "pressure" key of y
-            self.current_pressure = y["pressure"]
-
-            # store the value corresponding
-            # to the "humidity" key of y
-            self.current_humidity = y["humidity"]
-
-            # store the value of "weather"
-            # key in variable z
-            z = x["weather"]
-
-            # store the value corresponding
-            # to the "description" key at
-            # the 0th index of z
-            self.weather_description = z[0]["description"]
-
-            self.sunrise = x["sys"]["sunrise"]
-            self.sunset = x["sys"]["sunset"]
-
-            self.wind_speed = self.meters_per_second_to_mph(x["wind"]["speed"])
-            self.wind_direction = x["wind"]["deg"]
-
-            if "gust" in x["wind"]:
-                self.wind_gust = self.meters_per_second_to_mph(x["wind"]["gust"])
-            else:
-                self.wind_gust = self.wind_speed
-
-            # print following values
-            print(
-                " Temperature (in fahrenheit unit) = "
-                + str(self.current_temperature)
-                + "\n atmospheric pressure (in hPa unit) = "
-                + str(self.current_pressure)
-                + "\n humidity (in percentage) = "
-                + str(self.current_humidity)
-                + "\n description = "
-                + str(self.weather_description)
-            )
+        complete_url = (
+            f"{self.base_url}/data/2.5/weather?lat={lat}&lon={lon}&appid={key}"
+        )
+        x = self.poll(complete_url)
+        if x is not None:
+            self.parse(x)
+
+    def parse(self, x):
+        # cod is a number on success but a string on errors, and there are
+        # more errors than 404
+        if str(x.get("cod")) != "200":
+            print(f"OpenWeatherMap error {x.get('cod')}: {x.get('message')}")
+            return
+
+        # store the value of "main"
+        # key in variable y
+        y = x["main"]
+
+        # store the value of "weather"
+        # key in variable z
+        z = x["weather"]
+
+        wind_speed = self.meters_per_second_to_mph(x["wind"]["speed"])
+
+        if "gust" in x["wind"]:
+            wind_gust = self.meters_per_second_to_mph(x["wind"]["gust"])
+        else:
+            wind_gust = wind_speed
+
+        # build the new data off to the side then swap it in
+        data = self.data
+        self.data = models.Weather(
+            current_temperature=self.kelvin_to_fahrenheit(y["temp"]),
+            current_feels_like=self.kelvin_to_fahrenheit(y["feels_like"]),
+            current_pressure=y["pressure"],
+            current_humidity=y["humidity"],
+            # the "description" key at the 0th index of z
+            weather_description=z[0]["description"],
+            wind_speed=wind_speed,
+            wind_gust=wind_gust,
+            wind_direction=x["wind"]["deg"],
+            visibility=data.visibility,
+            sunrise=x["sys"]["sunrise"],
+            sunset=x["sys"]["sunset"],
+            fetched_at=time.time(),
+            version=data.version + 1,
+        )
+        data = self.data
+
+        # print following values
+        print(
+            " Temperature (in fahrenheit unit) = "
+            + str(data.current_temperature)
+            + "\n atmospheric pressure (in hPa unit) = "
+            + str(data.current_pressure)
+            + "\n humidity (in percentage) = "
+            + str(data.current_humidity)
+            + "\n description = "
+            + str(data.weather_description)
+        )
+
+    def restore(self, state, fetched_at):
+        self.data = models.Weather.from_state(state, fetched_at, self.data.version + 1)
 
     def kelvin_to_celsius(self, kelvin):
         return kelvin - 273.15
@@ -0,0 +1,538 @@
+# the things we draw on screen
+#
+# each widget declares where it is anchored and how often its content can
+# change. layout is solved once per resolution: the anchor becomes a point
+# on screen and the widget places everything relative to it. the render
+# loop only asks a widget to redraw when something it depends on has moved
+# on: the next frame, second, minute or day, or a new fetch from one of its
+# data sources. a change in the animated color also counts, since everything
+# is tinted.
+#
+# sources swap in a new frozen data object on every fetch (see models.py).
+# widgets take it once per draw so everything they show comes from the same
+# fetch.
+#
+# values from a source that has not had a good fetch in a while (usually a
+# warm start snapshot while the network is down) get their age tacked on.
+
+
+import time
+
+from gauge import GaugeSprites
+from plot import forecast_background, sparkline
+from profiling import stage
+from render_cache import tint
+from snapshot import age
+
+# refresh policies
+EVERY_FRAME = "frame"
+SECOND = "second"
+MINUTE = "minute"
+DAY = "day"
+DATA = "data"
+
+# anchors
+CENTER = "center"
+TOP_LEFT = "top left"
+TOP_RIGHT = "top right"
+BOTTOM_LEFT = "bottom left"
+
+
+def anchor_point(anchor, screen_size):
+    # the point on screen a widget with this anchor lays itself out from. the
+    # center can be half a pixel, widgets centered on it round once at the end
+    width, height = screen_size
+    return {
+        CENTER: (width / 2, height / 2),
+        TOP_LEFT: (0, 0),
+        TOP_RIGHT: (width, 0),
+        BOTTOM_LEFT: (0, height),
+    }[anchor]
+
+
+def format_usd(value):
+    return f"${value:,.2f}"
+
+
+def format_age(seconds):
+    if seconds < 60 * 60:
+        return f"{int(seconds // 60)}m"
+    if seconds < 24 * 60 * 60:
+        return f"{int(seconds // (60 * 60))}h"
+    return f"{int(seconds // (24 * 60 * 60))}d"
+
+
+class Frame:
+    # everything about "now" that widgets need, worked out once per frame
+    def __init__(self, current_time, color):
+        self.time = current_time
+        self.color = color
+        self.local = time.localtime(current_time)
+        self.second = int(current_time)
+        self.minute = (
+            self.local.tm_year,
+            self.local.tm_yday,
+            self.local.tm_hour,
+            self.local.tm_min,
+        )
+        self.day = (self.local.tm_year, self.local.tm_yday)
+
+    def strftime(self, format):
+        return time.strftime(format, self.local)
+
+
+class RenderContext:
+    # the fonts, caches and font metrics shared by every widget
+    def __init__(self, settings, compositor, labels, fonts, atlases):
+        self.settings = settings
+        self.compositor = compositor
+        self.labels = labels
+        self.font, self.font_small, self.font_tiny = fonts
+        self.atlas, self.atlas_small, self.atlas_tiny = atlases
+
+        self.blank_space = " "
+        if int(settings["space_doubling"]) > 1:
+            self.blank_space = " " * int(settings["space_doubling"])
+
+        self.height_tiny = self.atlas_tiny.height
+
+        self.width_time = self.atlas.width("55:55:55")
+        self.height_time = self.atlas.height
+
+        self.width_hundredths = self.atlas_small.width("55")
+        self.height_hundredths = self.atlas_small.height
+
+        # how old data can get before we show its age
+        self.stale_after = float(settings.get("stale_after_minutes", 15)) * 60
+
+
+class Widget:
+    anchor = CENTER
+    refresh = EVERY_FRAME
+
+    # widgets drawn in font_color redraw when it changes
+    tinted = True
+
+    def __init__(self, name, context):
+        self.name = name
+        self.context = context
+        self.last_token = None
+
+        # where the anchor is on screen, set by the tree before layout()
+        self.origin = (0, 0)
+
+    def layout(self, screen_size):
+        # work out positions for this resolution, relative to self.origin
+        pass
+
+    def data_version(self):
+        # widgets with the DATA policy return something that changes whenever
+        # their source has fetched new data
+        return None
+
+    def token(self, frame):
+        policies = self.refresh
+        if not isinstance(policies, tuple):
+            policies = (policies,)
+
+        token = [frame.color if self.tinted else None]
+        for policy in policies:
+            if policy == EVERY_FRAME:
+                token.append(frame.time)
+            elif policy == SECOND:
+                token.append(frame.second)
+            elif policy == MINUTE:
+                token.append(frame.minute)
+            elif policy == DAY:
+                token.append(frame.day)
+            elif policy == DATA:
+                token.append(self.data_version())
+        return tuple(token)
+
+    def update(self, frame):
+        token = self.token(frame)
+        if token == self.last_token:
+            return
+        self.last_token = token
+        self.draw(frame)
+
+    def draw(self, frame):
+        raise NotImplementedError
+
+    def staleness(self, data, frame):
+        # " (2h old)" once the source's data is older than stale_after
+        seconds = age(data, frame.time)
+        if seconds is None or seconds < self.context.stale_after:
+            return ""
+        return f" ({format_age(seconds)} old)"
+
+    def label(self, name, font, text, frame, position, right_align=False):
+        # only re-tint and re-place a label when its text or color changed
+        compositor = self.context.compositor
+        name = f"{self.name}.{name}"
+        key = (text, frame.color)
+        if compositor.is_current(name, key):
+            return
+
+        surface = self.context.labels.render(font, text, frame.color)
+
+        x, y = position
+        if right_align:
+            x -= surface.get_width()
+
+        compositor.place(name, surface, (x, y), key)
+
+    def glyphs(self, name, atlas, text, frame, position):
+        compositor = self.context.compositor
+        name = f"{self.name}.{name}"
+        key = (text, frame.color)
+        if compositor.is_current(name, key):
+            return
+
+        compositor.place(name, atlas.render(text, frame.color, name), position, key)
+
+
+class WidgetTree:
+    def __init__(self, widgets):
+        self.widgets = widgets
+        self.screen_size = None
+
+    def layout(self, screen_size):
+        if screen_size == self.screen_size:
+            return
+        self.screen_size = screen_size
+
+        for widget in self.widgets:
+            widget.origin = anchor_point(widget.anchor, screen_size)
+            widget.layout(screen_size)
+            widget.last_token = None
+
+    def update(self, frame):
+        with stage("widgets"):
+            for widget in self.widgets:
+                widget.update(frame)
+
+
+class ForecastPlotWidget(Widget):
+    # the next 24 hours of temperature and rain chances as the background
+    anchor = TOP_LEFT
+    refresh = DATA
+    tinted = False
+
+    def __init__(self, name, context, noaa):
+        super().__init__(name, context)
+        self.noaa = noaa
+
+    def layout(self, screen_size):
+        self.screen_size = screen_size
+
+    def data_version(self):
+        # new data, or the hour rolling over onto the next period
+        data = self.noaa.data
+        if data.hourly_index is None:
+            return None
+        return (data.version, data.hourly_index.first_active())
+
+    def draw(self, frame):
+        data = self.noaa.data
+        hourly_temperatures = data.hourly_temperatures()[:24]
+        hourly_rain_chances = data.hourly_rain_chances()[:24]
+
+        if not hourly_temperatures:
+            self.context.compositor.set_background(None)
+            return
+
+        self.context.compositor.set_background(
+            forecast_background(
+                self.screen_size, hourly_temperatures, hourly_rain_chances
+            )
+        )
+
+
+class ClockWidget(Widget):
+    # the big HH:MM:SS and AM/PM in the middle of the screen
+    anchor = CENTER
+    refresh = SECOND
+
+    def layout(self, screen_size):
+        c = self.context
+        self.x = int(self.origin[0] - c.width_time / 2)
+        self.y = int(self.origin[1] - c.height_time / 2)
+
+    def draw(self, frame):
+        c = self.context
+
+        # build a clock string of the current time in the format HH:MM:SS
+        clock_string = frame.strftime("%I:%M:%S")
+        # if the first character is a zero, replace it with two spaces for this font... oof. maybe a bad font pick..
+        if clock_string[0] == "0":
+            clock_string = c.blank_space + clock_string[1:]
+
+        self.glyphs("time", c.atlas, clock_string, frame, (self.x, self.y))
+
+        # %p to get AM or PM
+        self.glyphs(
+            "am_pm",
+            c.atlas,
+            frame.strftime(" %p"),
+            frame,
+            (self.x + c.width_time + c.width_hundredths, self.y),
+        )
+
+
+class HundredthsWidget(Widget):
+    # tenths or hundredths of a second next to the seconds
+    anchor = CENTER
+    refresh = EVERY_FRAME
+
+    def layout(self, screen_size):
+        c = self.context
+        self.position = (
+            int(self.origin[0] - c.width_time / 2) + c.width_time,
+            int(self.origin[1] - c.height_time / 2),
+        )
+
+    def draw(self, frame):
+        c = self.context
+
+        if c.settings["tenths_or_hundredths"] == "tenths":
+            text = str(int(frame.time * 10) % 10)
+        else:
+            text = f"{int(frame.time * 100) % 100:02d}"
+
+        self.glyphs("hundredths", c.atlas_small, text, frame, self.position)
+
+
+class TenthsGaugeWidget(Widget):
+    # a ring of nine segments that fills up over each second
+    anchor = CENTER
+    refresh = EVERY_FRAME
+
+    def __init__(self, name, context):
+        super().__init__(name, context)
+        self.sprites = None
+
+    def layout(self, screen_size):
+        c = self.context
+        font_size = c.settings["fontSize"]
+
+        # the sprites only depend on the font size, so only rebuild them if
+        # that changed
+        size = font_size // 3
+        thickness = font_size // int(c.settings["tick_thickness_divider"])
+        sprites = self.sprites
+        if sprites is None or (sprites.size, sprites.thickness) != (size, thickness):
+            self.sprites = GaugeSprites(size, thickness)
+
+        self.position = (
+            int(self.origin[0] - c.width_time / 2) + c.width_time,
+            int(self.origin[1] - c.height_time / 2)
+            + c.height_hundredths
+            - font_size // 6,
+        )
+
+    def draw(self, frame):
+        compositor = self.context.compositor
+
+        # the unlit ring never changes color so it is only placed again when
+        # the layout changes
+        name = f"{self.name}.ring"
+        key = (self.sprites, self.position)
+        if not compositor.is_current(name, key):
+            compositor.place(name, self.sprites.ring, self.position, key)
+
+        name = f"{self.name}.lit"
+        tenths = int(frame.time * 10) % 10
+
+        key = (tenths, frame.color)
+        if compositor.is_current(name, key):
+            return
+
+        compositor.place(
+            name, self.sprites.lit(tenths, frame.color), self.position, key
+        )
+
+
+class DateWidget(Widget):
+    # the date (ex. may 1, 2024) and the day of the week (ex. Monday)
+    anchor = TOP_LEFT
+    refresh = DAY
+
+    def draw(self, frame):
+        c = self.context
+        x, y = self.origin
+        self.label("date", c.font_small, frame.strftime("%B %d, %Y"), frame, (x, y))
+        self.label(
+            "weekday",
+            c.font_small,
+            frame.strftime("%A"),
+            frame,
+            (x, y + c.height_hundredths),
+        )
+
+
+class BtcWidget(Widget):
+    # the btc price with a sparkline of the last day next to it and how much
+    # it moved, below the date. the minute refresh keeps the age of a stale
+    # price current
+    anchor = TOP_LEFT
+    refresh = (MINUTE, DATA)
+
+    def __init__(self, name, context, cex):
+        super().__init__(name, context)
+        self.cex = cex
+
+        # the untinted sparkline and the history it was drawn from. it only
+        # changes when CEX records a tick, not on every price
+        self.sparkline_values = None
+        self.sparkline_white = None
+
+    def data_version(self):
+        return self.cex.data.version
+
+    def draw(self, frame):
+        c = self.context
+        cex = self.cex.data
+        x, y = self.origin
+        y += c.height_hundredths * 2
+
+        s_price = f"BTC {format_usd(cex.btc_usd)}{self.staleness(cex, frame)}"
+        self.label("price", c.font_tiny, s_price, frame, (x, y))
+
+        # the price label's width comes out of the label cache
+        width = c.labels.white(c.font_tiny, s_price).get_width()
+        self.sparkline(cex.sparkline, frame, (x + width + c.width_hundredths // 2, y))
+
+        btc_movement = cex.btc_usd - cex.last_btc_usd
+        if btc_movement < 0:
+            s_btc_chg = f"-{format_usd(btc_movement*-1)}"
+        else:
+            s_btc_chg = f"+{format_usd(btc_movement)}"
+        self.label("change", c.font_tiny, s_btc_chg, frame, (x, y + c.height_tiny))
+
+    def sparkline(self, values, frame, position):
+        compositor = self.context.compositor
+        name = f"{self.name}.sparkline"
+        if not values:
+            compositor.remove(name)
+            return
+
+        key = (values, position, frame.color)
+        if compositor.is_current(name, key):
+            return
+
+        if values != self.sparkline_values:
+            height = self.context.height_tiny
+            self.sparkline_white = sparkline(values, (height * 4, height))
+            self.sparkline_values = values
+
+        compositor.place(name, tint(self.sparkline_white, frame.color), position, key)
+
+
+class WeatherWidget(Widget):
+    # feels like, the current forecast and wind/humidity in the bottom left.
+    # the hourly forecast rolls over on the hour even without a fetch
+    anchor = BOTTOM_LEFT
+    refresh = (MINUTE, DATA)
+
+    def __init__(self, name, context, noaa, owm):
+        super().__init__(name, context)
+        self.noaa = noaa
+        self.owm = owm
+
+    def data_version(self):
+        return (self.noaa.data.version, self.owm.data.version)
+
+    def layout(self, screen_size):
+        self.left, self.bottom = self.origin
+
+    def draw(self, frame):
+        c = self.context
+        noaa = self.noaa.data
+        owm = self.owm.data
+
+        s_temp = ""
+        s_wind = ""
+        s_humidity = ""
+        s_shortcast = ""
+
+        forecast_now = noaa.current_hourly()
+        if forecast_now != "No Data":
+            s_shortcast = forecast_now.short_forecast
+            s_wind = f"wind: {forecast_now.wind_speed} {forecast_now.wind_direction}"
+            s_humidity = f"humidity: {forecast_now.humidity}%"
+            s_temp = f"{forecast_now.temperature}°F"
+
+        s_feels_like = f"Feels like {int(owm.current_feels_like)}°F"
+        s_feels_like += self.staleness(owm, frame)
+
+        # draw the feels like temperature above the weather
+        self.label(
+            "feels_like",
+            c.font_tiny,
+            s_feels_like,
+            frame,
+            (self.left, self.bottom - c.height_hundredths * 2 - c.height_tiny),
+        )
+
+        # draw the weather
+        self.label(
+            "weather",
+            c.font_small,
+            f"{s_shortcast} @ {s_temp}{self.staleness(noaa, frame)}",
+            frame,
+            (self.left, self.bottom - c.height_hundredths * 2),
+        )
+
+        # draw the wind and humidity below weather
+        self.label(
+            "wind_humidity",
+            c.font_small,
+            f"{s_wind}, {s_humidity}",
+            frame,
+            (self.left, self.bottom - c.height_hundredths),
+        )
+
+
+class SunWidget(Widget):
+    # the week number and the next sunrise or sunset in the top right, from
+    # a solar.SolarTable worked out locally rather than the weather api
+    anchor = TOP_RIGHT
+    refresh = (MINUTE,)
+
+    def __init__(self, name, context, sun):
+        super().__init__(name, context)
+        self.sun = sun
+
+    def layout(self, screen_size):
+        self.right, self.top = self.origin
+
+    def draw(self, frame):
+        c = self.context
+
+        # whichever of sunrise and sunset comes next, tomorrow's sunrise once
+        # the sun has set
+        event = self.sun.next_event(frame.time)
+        if event is None:
+            # the sun is staying up or down for days
+            s_sun = "No sunrise or sunset"
+        else:
+            name, when = event
+            s_sun = f"{name.capitalize()} @ {time.strftime('%I:%M %p', time.localtime(when))}"
+
+        self.label(
+            "week_number",
+            c.font_small,
+            frame.strftime("Week %U"),
+            frame,
+            (self.right, self.top),
+            right_align=True,
+        )
+        self.label(
+            "sun",
+            c.font_small,
+            s_sun,
+            frame,
+            (self.right, self.top + c.height_hundredths),
+            right_align=True,
+        )
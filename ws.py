@@ -0,0 +1,218 @@
+# just enough of RFC 6455 websockets on top of asyncio streams
+#
+# we only need text messages, pings and a clean close, for the streaming
+# price feed (cex_stream.py) and the stub feed server we test it against
+# (stub_feed.py), so this is a couple of hundred lines rather than another
+# dependency. no extensions, no compression.
+
+
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+from urllib.parse import urlsplit
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+# nothing we talk to sends anything near this big
+MAX_MESSAGE = 1 << 20
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+def accept_key(key):
+    digest = hashlib.sha1((key + GUID).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+def encode_frame(opcode, payload, mask):
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", length)
+
+    # clients have to mask everything they send, servers never do
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+
+    return bytes(header) + payload
+
+
+async def read_frame(reader):
+    # (fin, opcode, payload)
+    first, second = await reader.readexactly(2)
+    fin = bool(first & 0x80)
+    opcode = first & 0x0F
+    masked = bool(second & 0x80)
+
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_MESSAGE:
+        raise ConnectionClosed(f"frame of {length} bytes is too big")
+
+    key = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(length)
+    if key:
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+
+    return fin, opcode, payload
+
+
+class WebSocket:
+    def __init__(self, reader, writer, mask):
+        self.reader = reader
+        self.writer = writer
+        self.mask = mask
+        self.closed = False
+
+    async def send(self, text):
+        await self.__send(TEXT, text.encode())
+
+    async def ping(self, payload=b""):
+        await self.__send(PING, payload)
+
+    async def recv(self):
+        # the next text message. answers pings and closes along the way
+        fragments = []
+        while True:
+            try:
+                fin, opcode, payload = await read_frame(self.reader)
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                self.closed = True
+                raise ConnectionClosed(str(e) or "connection lost") from e
+
+            if opcode == PING:
+                await self.__send(PONG, payload)
+                continue
+            if opcode == PONG:
+                continue
+            if opcode == CLOSE:
+                if not self.closed:
+                    await self.close()
+                raise ConnectionClosed("closed by peer")
+
+            fragments.append(payload)
+            if sum(len(fragment) for fragment in fragments) > MAX_MESSAGE:
+                raise ConnectionClosed("message is too big")
+            if fin:
+                return b"".join(fragments).decode()
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.writer.write(encode_frame(CLOSE, struct.pack("!H", 1000), self.mask))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+    async def __send(self, opcode, payload):
+        if self.closed:
+            raise ConnectionClosed("already closed")
+        try:
+            self.writer.write(encode_frame(opcode, payload, self.mask))
+            await self.writer.drain()
+        except ConnectionError as e:
+            self.closed = True
+            raise ConnectionClosed(str(e)) from e
+
+
+async def read_headers(reader):
+    # the request or status line and the headers of an http/1.1 handshake
+    lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+async def connect(url, timeout=10):
+    parts = urlsplit(url)
+    secure = parts.scheme == "wss"
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(
+            parts.hostname,
+            port,
+            ssl=ssl.create_default_context() if secure else None,
+        ),
+        timeout,
+    )
+
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write(
+        (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            "\r\n"
+        ).encode()
+    )
+    await writer.drain()
+
+    status, headers = await asyncio.wait_for(read_headers(reader), timeout)
+    accepted = headers.get("sec-websocket-accept") == accept_key(key)
+    if " 101 " not in f"{status} " or not accepted:
+        writer.close()
+        raise ConnectionClosed(f"handshake failed: {status}")
+
+    return WebSocket(reader, writer, mask=True)
+
+
+async def accept(reader, writer):
+    # the server side of the handshake
+    request, headers = await read_headers(reader)
+    key = headers.get("sec-websocket-key")
+    if key is None or headers.get("upgrade", "").lower() != "websocket":
+        writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+        raise ConnectionClosed(f"not a websocket request: {request}")
+
+    writer.write(
+        (
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(key)}\r\n"
+            "\r\n"
+        ).encode()
+    )
+    await writer.drain()
+
+    return WebSocket(reader, writer, mask=False)